@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# Instantánea columnar de las estadísticas de niveles
+# Uso offline: python analytics.py report [--db-url URL]
+
+import argparse
+import asyncio
+import datetime
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.db import Database
+from database.models import Level
+from invalidation import invalidation_bus, LEVEL
+
+from config import ANALYTICS_REFRESH_INTERVAL
+
+# Column name -> dtype, in select order
+COLUMNS: dict[str, type] = {
+    "id": np.int64,
+    "style": np.int16,
+    "environment": np.int16,
+    "tag_1": np.int16,
+    "tag_2": np.int16,
+    "date": np.int32,  # date.toordinal()
+    "likes": np.int64,
+    "dislikes": np.int64,
+    "plays": np.int64,
+    "deaths": np.int64,
+    "clears": np.int64,
+    "featured": np.bool_,
+    "testing_client": np.bool_,
+}
+
+# Clear rate ranges of the difficulty filter, same thresholds as search
+DIFFICULTY_RANGES: dict[str, tuple[float, float]] = {
+    "0": (0.2, 10.0),
+    "1": (0.08, 0.2),
+    "2": (0.01, 0.08),
+    "3": (0.0, 0.01),
+}
+
+
+def select_snapshot_rows():
+    return select(*(getattr(Level, name) for name in COLUMNS)).select_from(Level)
+
+
+def rows_to_columns(rows) -> dict[str, np.ndarray]:
+    columns = {name: [] for name in COLUMNS}
+    for row in rows:
+        for name, value in zip(COLUMNS, row):
+            if name == "date":
+                value = value.toordinal() if value is not None else 0
+            columns[name].append(value or 0)
+    return {name: np.array(values, dtype=COLUMNS[name]) for name, values in columns.items()}
+
+
+class LevelSnapshot:
+    """
+    In-memory columnar copy of the level catalog, sorted by id.
+    Levels changed since the last refresh are collected from the invalidation
+    bus and reloaded by id, so refreshes don't read the whole table.
+    """
+
+    def __init__(self):
+        self.columns: dict[str, np.ndarray] = rows_to_columns([])
+        self.dirty_ids: set[int] = set()
+        self.ready: bool = False
+
+    def __len__(self) -> int:
+        return len(self.columns["id"])
+
+    def mark_dirty(self, key: str):
+        self.dirty_ids.add(int(key))
+
+    async def load(self, session: AsyncSession):
+        self.dirty_ids = set()
+        rows = (await session.execute(select_snapshot_rows().order_by(Level.id))).all()
+        self.columns = rows_to_columns(rows)
+        self.ready = True
+
+    async def refresh(self, session: AsyncSession):
+        if not self.ready:
+            return await self.load(session)
+        if not self.dirty_ids:
+            return
+        level_db_ids, self.dirty_ids = sorted(self.dirty_ids), set()
+        try:
+            rows = (await session.execute(
+                select_snapshot_rows().where(Level.id.in_(level_db_ids)).order_by(Level.id)
+            )).all()
+        except Exception:
+            self.dirty_ids.update(level_db_ids)
+            raise
+        self.apply(np.array(level_db_ids, dtype=np.int64), rows_to_columns(rows))
+
+    def apply(self, level_db_ids: np.ndarray, changed: dict[str, np.ndarray]):
+        # rows of level_db_ids that no longer exist are deleted, the others are updated or inserted
+        ids = self.columns["id"]
+        positions = np.searchsorted(ids, level_db_ids)
+        exists = positions < len(ids)
+        exists[exists] = ids[positions[exists]] == level_db_ids[exists]
+        deleted = positions[exists & ~np.isin(level_db_ids, changed["id"])]
+        columns = {name: np.delete(column, deleted) for name, column in self.columns.items()}
+
+        ids = columns["id"]
+        positions = np.searchsorted(ids, changed["id"])
+        exists = positions < len(ids)
+        exists[exists] = ids[positions[exists]] == changed["id"][exists]
+        for name, column in columns.items():
+            column[positions[exists]] = changed[name][exists]
+            columns[name] = np.insert(column, positions[~exists], changed[name][~exists])
+        self.columns = columns
+
+    def clear_rates(self) -> np.ndarray:
+        plays = self.columns["plays"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(plays > 0, self.columns["clears"] / plays, np.nan)
+
+    def wilson_scores(self, z: float = 1.96) -> np.ndarray:
+        # lower bound of the Wilson score interval of the like ratio
+        likes = self.columns["likes"].astype(np.float64)
+        total = likes + self.columns["dislikes"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = likes / total
+            score = (ratio + z * z / (2 * total) - z * np.sqrt(
+                (ratio * (1 - ratio) + z * z / (4 * total)) / total
+            )) / (1 + z * z / total)
+        return np.where(total > 0, score, 0.0)
+
+    def difficulty_quantiles(self, quantiles=(0.25, 0.5, 0.75)) -> np.ndarray:
+        rates = self.clear_rates()
+        rates = rates[~np.isnan(rates)]
+        return np.quantile(rates, quantiles) if len(rates) else np.full(len(quantiles), np.nan)
+
+    def mask(self, difficulty: str | None = None, include_testing: bool = True) -> np.ndarray:
+        mask = np.ones(len(self), dtype=np.bool_)
+        if not include_testing:
+            mask &= ~self.columns["testing_client"]
+        if difficulty is not None:
+            low, high = DIFFICULTY_RANGES[difficulty]
+            rates = self.clear_rates()
+            with np.errstate(invalid="ignore"):
+                mask &= (rates >= low) & (rates <= high)
+        return mask
+
+    def random_level_id(self, mask: np.ndarray) -> int | None:
+        candidates = self.columns["id"][mask]
+        if not len(candidates):
+            return None
+        return int(np.random.choice(candidates))
+
+    def report(self, top: int = 10) -> dict:
+        scores = self.wilson_scores()
+        best = np.argsort(scores)[::-1][:top]
+        return {
+            "levels": len(self),
+            "featured": int(self.columns["featured"].sum()),
+            "testing_client": int(self.columns["testing_client"].sum()),
+            "plays": int(self.columns["plays"].sum()),
+            "clears": int(self.columns["clears"].sum()),
+            "clear_rate_quantiles": {
+                str(q): float(value) for q, value in
+                zip((0.25, 0.5, 0.75), self.difficulty_quantiles((0.25, 0.5, 0.75)))
+            },
+            "difficulty_counts": {
+                difficulty: int(self.mask(difficulty).sum()) for difficulty in DIFFICULTY_RANGES
+            },
+            "top_wilson": [
+                {"id": int(self.columns["id"][i]), "score": round(float(scores[i]), 4)} for i in best
+            ],
+        }
+
+
+level_snapshot = LevelSnapshot()
+
+# Every level change, local or from other workers, is reloaded on the next refresh
+invalidation_bus.subscribe(LEVEL, level_snapshot.mark_dirty)
+
+
+async def snapshot_refresher(database: Database):
+    while True:
+        try:
+            async with database.async_session() as session:
+                await level_snapshot.refresh(session)
+        except Exception as e:
+            print(f"Analytics snapshot refresh failed: {e}")
+        await asyncio.sleep(ANALYTICS_REFRESH_INTERVAL)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Engine Tribe level statistics")
+    parser.add_argument("--db-url", default="sqlite+aiosqlite:///levels.db", help="Levels database URL")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("report", help="Print a statistics report of the level catalog")
+    args = parser.parse_args()
+
+    database = Database(db_url=args.db_url)
+    try:
+        async with database.async_session() as session:
+            await level_snapshot.load(session)
+        print(f"Engine Tribe level report ({datetime.date.today().isoformat()})")
+        for key, value in level_snapshot.report().items():
+            print(f"{key}: {value}")
+    finally:
+        await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from redis.exceptions import RedisError
+
+
+class LRUBytesCache:
+    """
+    In-memory LRU bounded by total size.
+    Values are byte strings unless a custom size_of is given.
+    """
+
+    def __init__(self, max_bytes: int, size_of: Callable[[Any], int] = len):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.size_of = size_of
+        self._items: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        self.pop(key)
+        if self.size_of(value) > self.max_bytes:
+            return
+        self._items[key] = value
+        self.size += self.size_of(value)
+        while self.size > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= self.size_of(evicted)
+
+    def pop(self, key: Hashable):
+        value = self._items.pop(key, None)
+        if value is not None:
+            self.size -= self.size_of(value)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class DiskLRUCache:
+    """
+    LRU of files in a directory bounded by total size.
+    The index lives in memory and is rebuilt from file mtimes on start, so the
+    recency order survives restarts.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._index: OrderedDict[str, int] = OrderedDict()
+        os.makedirs(path, exist_ok=True)
+        entries = sorted(
+            (entry for entry in os.scandir(path) if entry.is_file() and not entry.name.endswith(".tmp")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in entries:
+            self._index[entry.name] = entry.stat().st_size
+            self.size += self._index[entry.name]
+        self._remove_files(self._pick_victims())
+
+    @staticmethod
+    def file_name(key: str) -> str:
+        # Keys may come from URLs, never use them as file names directly
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _file_path(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _pick_victims(self) -> list[str]:
+        # runs on the event loop, the only place _index and size are changed
+        victims: list[str] = []
+        while self.size > self.max_bytes and self._index:
+            name, size = self._index.popitem(last=False)
+            self.size -= size
+            victims.append(name)
+        return victims
+
+    def _remove_files(self, names: list[str]):
+        for name in names:
+            try:
+                os.remove(self._file_path(name))
+            except FileNotFoundError:
+                pass
+
+    def _read(self, name: str) -> bytes:
+        file_path = self._file_path(name)
+        with open(file_path, "rb") as f:
+            data = f.read()
+        os.utime(file_path)
+        return data
+
+    def _write(self, name: str, value: bytes):
+        tmp_path = self._file_path(name) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(value)
+        os.replace(tmp_path, self._file_path(name))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        name = self.file_name(key)
+        if name not in self._index:
+            return None
+        try:
+            data = await asyncio.to_thread(self._read, name)
+        except FileNotFoundError:
+            self.size -= self._index.pop(name, 0)
+            return None
+        if name in self._index:
+            self._index.move_to_end(name)
+        return data
+
+    async def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        name = self.file_name(key)
+        await asyncio.to_thread(self._write, name, value)
+        self.size -= self._index.pop(name, 0)
+        self._index[name] = len(value)
+        self.size += len(value)
+        if self.size > self.max_bytes:
+            await asyncio.to_thread(self._remove_files, self._pick_victims())
+
+    async def pop(self, key: str):
+        name = self.file_name(key)
+        if name in self._index:
+            self.size -= self._index.pop(name)
+            try:
+                await asyncio.to_thread(os.remove, self._file_path(name))
+            except FileNotFoundError:
+                pass
+
+    def __contains__(self, key: str) -> bool:
+        return self.file_name(key) in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into a single execution.
+    The execution runs in its own task, so a cancelled caller, the first one
+    included, stops waiting without cancelling it for the others.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Hashable, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            future.exception()  # Mark as retrieved when nobody else is waiting
+
+
+class VersionCounter:
+    """
+    Per-key change counters used to invalidate cached renderings.
+    A key's version is the value of a shared clock at its last bump, so reading the
+    clock before a query tells which rows may have changed while it ran.
+    """
+
+    def __init__(self):
+        self.versions: dict[Hashable, int] = {}
+        self.clock: int = 0
+
+    def get(self, key: Hashable) -> int:
+        return self.versions.get(key, 0)
+
+    def get_as_of(self, key: Hashable, clock: int) -> int | None:
+        # None when the key was bumped after clock was read, data loaded since must not be cached
+        version = self.get(key)
+        return version if version <= clock else None
+
+    def bump(self, key: Hashable):
+        self.clock += 1
+        self.versions[key] = self.clock
+
+
+class TTLCache:
+    """
+    Short-lived cache of JSON serializable values, kept in process and
+    optionally shared between workers through Redis.
+    """
+
+    def __init__(self, ttl: int, max_entries: int, prefix: str):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.entries = LRUBytesCache(max_bytes=max_entries, size_of=lambda _: 1)
+        self.redis = None  # set on startup when the Redis tier is enabled
+
+    def _redis_key(self, key: tuple) -> str:
+        return self.prefix + hashlib.sha1(repr(key).encode()).hexdigest()
+
+    async def version(self, local_version: int) -> int | None:
+        # A per-process counter can't key entries shared between workers, they use a Redis counter.
+        # None when Redis is unreachable, the caller then skips the cache
+        if self.redis is None:
+            return local_version
+        try:
+            return int(await self.redis.get(self.prefix + "version") or 0)
+        except RedisError:
+            return None
+
+    async def bump_version(self):
+        # if this fails, shared entries still expire after ttl
+        if self.redis is not None:
+            try:
+                await self.redis.incr(self.prefix + "version")
+            except RedisError:
+                pass
+
+    async def get(self, key: tuple) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                return entry[1]
+            self.entries.pop(key)
+        if self.redis is not None:
+            try:
+                data = await self.redis.get(self._redis_key(key))
+            except RedisError:
+                return None
+            if data is not None:
+                value = json.loads(data)
+                self.entries.put(key, (time.monotonic() + self.ttl, value))
+                return value
+        return None
+
+    async def put(self, key: tuple, value: Any):
+        self.entries.put(key, (time.monotonic() + self.ttl, value))
+        if self.redis is not None:
+            try:
+                await self.redis.set(self._redis_key(key), json.dumps(value), ex=self.ttl)
+            except RedisError:
+                pass
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Exportación en streaming del catálogo de niveles
+# Uso offline: python catalog_export.py [--format ndjson|csv] [--interactions] [--gzip] [-o FILE] [--db-url URL]
+
+import argparse
+import asyncio
+import csv
+import io
+import sys
+import zlib
+from typing import AsyncIterator
+
+import orjson
+from sqlalchemy import select, func, case
+
+from database.db import Database
+from database.models import Level, LevelInteraction, INTERACTION_LIKED, INTERACTION_DISLIKED, INTERACTION_CLEARED
+
+EXPORT_CHUNK_ROWS = 1000  # Rows read per transaction
+
+LEVEL_FIELDS = ("level_id", "name", "description", "style", "environment", "tag_1", "tag_2", "date",
+                "author_id", "likes", "dislikes", "plays", "deaths", "clears", "record_user_id", "record",
+                "featured", "testing_client")
+INTERACTION_FIELDS = ("liked_users", "disliked_users", "cleared_users")
+
+FORMATS: dict[str, str] = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def export_fields(interactions: bool) -> tuple[str, ...]:
+    return LEVEL_FIELDS + INTERACTION_FIELDS if interactions else LEVEL_FIELDS
+
+
+def select_export_rows(after_id: int, limit: int):
+    return select(Level.id, *(getattr(Level, name) for name in LEVEL_FIELDS)).select_from(Level) \
+        .where(Level.id > after_id).order_by(Level.id).limit(limit)
+
+
+def select_interaction_counts(level_db_ids: list[int]):
+    # users that liked, disliked and cleared each of the given levels
+    return select(
+        LevelInteraction.level_id,
+        *(func.sum(case((LevelInteraction.flags.op('&')(flag) != 0, 1), else_=0)).label(name)
+          for flag, name in zip((INTERACTION_LIKED, INTERACTION_DISLIKED, INTERACTION_CLEARED), INTERACTION_FIELDS))
+    ).where(LevelInteraction.level_id.in_(level_db_ids)).group_by(LevelInteraction.level_id)
+
+
+async def stream_level_rows(database: Database, interactions: bool,
+                            chunk_rows: int = EXPORT_CHUNK_ROWS) -> AsyncIterator[list[dict]]:
+    # Keyset chunks, each read in its own short transaction: a slow download never holds
+    # a read lock that would make level writes fail with "database is locked"
+    last_id: int = 0
+    while True:
+        async with database.async_session() as session:
+            rows = (await session.execute(select_export_rows(last_id, chunk_rows))).mappings().all()
+            if not rows:
+                return
+            level_db_ids: list[int] = [row["id"] for row in rows]
+            counts: dict[int, dict] = {}
+            if interactions:
+                counts = {
+                    row["level_id"]: row
+                    for row in (await session.execute(select_interaction_counts(level_db_ids))).mappings().all()
+                }
+        last_id = level_db_ids[-1]
+        records: list[dict] = []
+        for row in rows:
+            record = {name: row[name] for name in LEVEL_FIELDS}
+            if interactions:
+                level_counts = counts.get(row["id"])
+                record.update({name: level_counts[name] if level_counts else 0 for name in INTERACTION_FIELDS})
+            records.append(record)
+        yield records
+
+
+def encode_ndjson(records: list[dict]) -> bytes:
+    return b"".join(orjson.dumps(record) + b"\n" for record in records)
+
+
+def encode_csv(records: list[dict], fields: tuple[str, ...], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    if header:
+        writer.writeheader()
+    writer.writerows(records)
+    return buffer.getvalue().encode()
+
+
+async def export_catalog(database: Database, format: str = "ndjson", interactions: bool = False,
+                         compress: bool = False) -> AsyncIterator[bytes]:
+    """
+    Yields the level catalog as NDJSON or CSV bytes, one chunk per keyset chunk of levels,
+    gzip compressed on the fly when asked.
+    """
+    fields = export_fields(interactions)
+    # wbits=31 writes a gzip header and trailer
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    header = True
+    async for records in stream_level_rows(database, interactions):
+        if format == "csv":
+            chunk = encode_csv(records, fields, header)
+            header = False
+        else:
+            chunk = encode_ndjson(records)
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    if format == "csv" and header:
+        # empty catalog, still a valid CSV
+        chunk = encode_csv([], fields, True)
+        yield compressor.compress(chunk) if compressor is not None else chunk
+    if compressor is not None:
+        yield compressor.flush()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Engine Tribe level catalog export")
+    parser.add_argument("--db-url", default="sqlite+aiosqlite:///levels.db", help="Levels database URL")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson", help="Output format")
+    parser.add_argument("--interactions", action="store_true",
+                        help="Add the number of users that liked, disliked and cleared each level")
+    parser.add_argument("--gzip", action="store_true", help="Compress the output with gzip")
+    parser.add_argument("-o", "--output", help="Output file, standard output by default")
+    args = parser.parse_args()
+
+    database = Database(db_url=args.db_url)
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async for chunk in export_catalog(database, format=args.format, interactions=args.interactions,
+                                          compress=args.gzip):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+        await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,3 +1,4 @@
+import asyncio
 import base64
 from dataclasses import dataclass
 from enum import Enum
@@ -8,9 +9,12 @@ from xpinyin import Pinyin
 
 from locales import *
 
+from cache import LRUBytesCache, TTLCache
+from config import LEVEL_DETAILS_CACHE_ENTRIES, SEARCH_CACHE_TTL, SEARCH_CACHE_ENTRIES
 from database.models import Level
+from database.levels_db_access import LevelRow
+from invalidation import invalidation_bus, LISTING, TRENDING
 
-from models import LevelDetails, LevelDetailsUserData
 
 
 class ClientType(Enum):
@@ -30,9 +34,10 @@ class AuthCodeData:
     testing_client: bool
 
 
-def level_to_details(level_data: Level, locale: str, level_file_url: str, mobile: bool, like_type: str,
+def level_to_details(level_data: Level | LevelRow, locale: str, level_file_url: str, mobile: bool, like_type: str,
                      clear_type: str,
-                     author: str, record_user: str):
+                     author: str, record_user: str) -> dict:
+    # Plain dict in models.LevelDetails field order, skipping pydantic validation on the hot path
     if mobile and level_data.non_latin:
         name: str = string_latinify(level_data.name)
     else:
@@ -49,29 +54,76 @@ def level_to_details(level_data: Level, locale: str, level_file_url: str, mobile
     if desc == '' or desc is None:
         desc = 'Sin descripción'
 
-    return LevelDetails(
-        name=name,
-        likes=level_data.likes,
-        dislikes=level_data.dislikes,
-        comments=0,
-        intentos=level_data.plays,
-        muertes=level_data.deaths,
-        victorias=level_data.clears,
-        apariencia=level_data.style,
-        entorno=level_data.environment,
-        etiquetas=f'{prettify_tag_name(level_data.tag_1, locale)},{prettify_tag_name(level_data.tag_2, locale)}',
-        featured=int(level_data.featured),
-        user_data=LevelDetailsUserData(
-            completed=clear_type,
-            liked=like_type
-        ),
-        date=level_data.date.strftime("%m/%d/%Y"),
-        author=author,
-        record=record,
-        archivo=level_file_url,
-        id=level_data.level_id,
-        descripcion=desc,
-    )
+    return {
+        'name': name,
+        'likes': level_data.likes,
+        'dislikes': level_data.dislikes,
+        'comments': 0,
+        'intentos': level_data.plays,
+        'muertes': level_data.deaths,
+        'victorias': level_data.clears,
+        'apariencia': level_data.style,
+        'entorno': level_data.environment,
+        'etiquetas': f'{prettify_tag_name(level_data.tag_1, locale)},{prettify_tag_name(level_data.tag_2, locale)}',
+        'featured': int(level_data.featured),
+        'user_data': {
+            'completed': clear_type,
+            'liked': like_type
+        },
+        'record': record,
+        'date': level_data.date.strftime("%m/%d/%Y"),
+        'author': author,
+        'descripcion': desc,
+        'archivo': level_file_url,
+        'id': level_data.level_id,
+    }
+
+
+class LevelDetailsCache:
+    """
+    Rendered level details keyed by (level db id, locale, mobile, proxied).
+    An entry is only valid for the level version it was rendered from, and
+    holds no per-user data, see with_user_data().
+    """
+
+    def __init__(self, max_entries: int):
+        self.entries = LRUBytesCache(max_bytes=max_entries, size_of=lambda _: 1)
+
+    def get(self, key: tuple, version: int | None) -> dict | None:
+        if version is None:
+            return None
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        return None
+
+    def put(self, key: tuple, version: int | None, details: dict):
+        # version None: the level changed while it was loaded, don't keep the rendering
+        if version is not None:
+            self.entries.put(key, (version, details))
+
+
+level_details_cache = LevelDetailsCache(max_entries=LEVEL_DETAILS_CACHE_ENTRIES)
+
+# Ordered level db ids and row count of non user-specific search pages
+search_page_cache = TTLCache(ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_ENTRIES, prefix='enginetribe:search:')
+_version_bumps: set[asyncio.Task] = set()
+
+
+def _bump_search_page_version(key: str):
+    # each listing change bumps the shared counter once, from the worker that made it
+    task = asyncio.get_running_loop().create_task(search_page_cache.bump_version())
+    _version_bumps.add(task)
+    task.add_done_callback(_version_bumps.discard)
+
+
+invalidation_bus.subscribe(LISTING, _bump_search_page_version, local_only=True)
+invalidation_bus.subscribe(TRENDING, _bump_search_page_version, local_only=True)
+
+
+def with_user_data(details: dict, like_type: str, clear_type: str) -> dict:
+    # copy keeps the key order of details
+    return {**details, 'user_data': {'completed': clear_type, 'liked': like_type}}
 
 
 def gen_level_id_md5(stripped_swe: str) -> str:
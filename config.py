@@ -26,6 +26,10 @@ WORKERS = _config["enginetribe"]["workers"]
 VERIFY_USER_AGENT = _config["enginetribe"]["verify_user_agent"]
 API_KEY = _config["enginetribe"]["api_key"]
 ROWS_PERPAGE = _config["enginetribe"]["rows_perpage"]
+BATCH_MAX_LEVELS = _config["enginetribe"]["batch_max_levels"]
+STATS_BATCH_MAX_EVENTS = _config["enginetribe"]["stats_batch_max_events"]
+CHANGES_MAX_ROWS = _config["enginetribe"]["changes_max_rows"]
+CHANGES_SETTLE_MS = _config["enginetribe"]["changes_settle_ms"]
 UPLOAD_LIMIT = _config["enginetribe"]["upload_limit"]
 BOOSTERS_EXTRA_LIMIT = _config["enginetribe"]["booster_extra_limit"]
 RECORD_CLEAR_USERS = _config["enginetribe"]["record_clear_users"]
@@ -48,13 +52,14 @@ if DATABASE_ADAPTER == 'sqlite':
     # This is the line to fix.
     # The URL needs to specify the aiosqlite driver for async support.
     USERS_DATABASE_URL = f'sqlite+aiosqlite:///./users.db'
-    LEVELS_DATABASE_URL = f'sqlite+aiosqlite:///./levels.db'
 elif DATABASE_ADAPTER == 'postgresql':
     DATABASE_URL = f'postgresql+asyncpg://{DATABASE_USER}:{DATABASE_PASS}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}'
 elif DATABASE_ADAPTER == 'mysql':
     DATABASE_URL = f'mysql+aiomysql://{DATABASE_USER}:{DATABASE_PASS}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}'
 else:
     raise ValueError(f'Unsupported database adapter: {DATABASE_ADAPTER}')
+# Levels are always kept in SQLite, whatever the users database adapter
+LEVELS_DATABASE_URL = f'sqlite+aiosqlite:///./levels.db'
 
 # Redis Configurations
 SESSION_REDIS_HOST = _config['redis']['host']
@@ -68,12 +73,60 @@ STORAGE_URL = _config['storage']['url']
 STORAGE_AUTH_KEY = _config['storage']['auth_key']
 STORAGE_PROXIED = _config['storage']['proxied']
 STORAGE_ATTACHMENT_CHANNEL_ID = _config['storage']['attachment_channel_id']
+STORAGE_CACHE_ENABLED = _config['storage']['cache']['enabled']
+STORAGE_CACHE_PATH = _config['storage']['cache']['path']
+STORAGE_CACHE_MAX_SIZE = _config['storage']['cache']['max_size_mb'] * 1024 * 1024
+STORAGE_CACHE_MEMORY_MAX_SIZE = _config['storage']['cache']['memory_max_size_mb'] * 1024 * 1024
+
+# Cache Configurations
+LEVEL_DETAILS_CACHE_ENTRIES = _config['cache']['level_details_entries']
+SEARCH_CACHE_TTL = _config['cache']['search_ttl']
+SEARCH_CACHE_ENTRIES = _config['cache']['search_entries']
+SEARCH_CACHE_REDIS = _config['cache']['search_redis']
+INTERACTION_CACHE_USERS = _config['cache']['interaction_users']
+
+# Analytics Configurations
+ANALYTICS_REFRESH_INTERVAL = _config['analytics']['refresh_interval']
+
+# Trending Configurations
+TRENDING_INTERVAL = _config['trending']['interval']
+TRENDING_WINDOW_HOURS = _config['trending']['window_days'] * 24
+TRENDING_HALF_LIFE_HOURS = _config['trending']['half_life_hours']
+TRENDING_TOP_N = _config['trending']['top_n']
+TRENDING_WEIGHTS = _config['trending']['weights']
+
+# Static Proxy Configurations
+STATIC_PROXY_UPSTREAM_URL = _config['static_proxy']['upstream_url']
+STATIC_PROXY_MAX_SIZE = _config['static_proxy']['max_size_mb'] * 1024 * 1024
+STATIC_PROXY_PATH = _config['static_proxy']['path']
+STATIC_PROXY_MAX_AGE = _config['static_proxy']['max_age']
+STATIC_PROXY_NEGATIVE_TTL = _config['static_proxy']['negative_ttl']
+
+# Invalidation Configurations
+INVALIDATION_BACKEND = _config['invalidation']['backend']
+INVALIDATION_POLL_INTERVAL = _config['invalidation']['poll_interval']
+INVALIDATION_RETENTION = _config['invalidation']['retention']
+
+# Outbound HTTP Configurations
+HTTP_LIMIT_PER_HOST = _config['http']['limit_per_host']
+HTTP_KEEPALIVE_TIMEOUT = _config['http']['keepalive_timeout']
+HTTP_DNS_CACHE_TTL = _config['http']['dns_cache_ttl']
+HTTP_CONNECT_TIMEOUT = _config['http']['connect_timeout']
+HTTP_READ_TIMEOUT = _config['http']['read_timeout']
 
 # Push Configurations (Engine Bot)
 ENABLE_ENGINE_BOT_WEBHOOK = _config['push']['engine_bot']['enabled']
 ENABLE_ENGINE_BOT_COUNTER_WEBHOOK = _config['push']['engine_bot']['enable_counter']
 ENABLE_ENGINE_BOT_ARRIVAL_WEBHOOK = _config['push']['engine_bot']['enable_new_arrival']
 ENGINE_BOT_WEBHOOK_URLS = _config['push']['engine_bot']['urls']
+ENGINE_BOT_QUEUE_SIZE = _config['push']['engine_bot']['queue_size']
+ENGINE_BOT_QUEUE_OVERFLOW = _config['push']['engine_bot']['queue_overflow']
+ENGINE_BOT_WORKERS = _config['push']['engine_bot']['workers']
+ENGINE_BOT_CONCURRENCY_PER_URL = _config['push']['engine_bot']['concurrency_per_url']
+ENGINE_BOT_MAX_RETRIES = _config['push']['engine_bot']['max_retries']
+ENGINE_BOT_RETRY_BACKOFF = _config['push']['engine_bot']['retry_backoff']
+ENGINE_BOT_BREAKER_THRESHOLD = _config['push']['engine_bot']['circuit_breaker_threshold']
+ENGINE_BOT_BREAKER_RESET = _config['push']['engine_bot']['circuit_breaker_reset']
 
 # Push Configurations (Discord)
 ENABLE_DISCORD_WEBHOOK = _config['push']['discord']['enabled']
@@ -81,4 +134,14 @@ ENABLE_DISCORD_ARRIVAL_WEBHOOK = _config['push']['discord']['enable_new_arrival'
 DISCORD_WEBHOOK_URLS = _config['push']['discord']['urls']
 DISCORD_AVATAR_URL = _config['push']['discord']['avatar']
 DISCORD_NICKNAME = _config['push']['discord']['nickname']
-DISCORD_SERVER_NAME = _config['push']['discord']['server_name']
\ No newline at end of file
+DISCORD_SERVER_NAME = _config['push']['discord']['server_name']
+DISCORD_BATCH_WINDOW = _config['push']['discord']['batch_window']
+DISCORD_MAX_RETRIES = _config['push']['discord']['max_retries']
+
+# Push Configurations (Outbox)
+OUTBOX_POLL_INTERVAL = _config['push']['outbox']['poll_interval']
+OUTBOX_BATCH_SIZE = _config['push']['outbox']['batch_size']
+OUTBOX_MAX_ATTEMPTS = _config['push']['outbox']['max_attempts']
+OUTBOX_RETENTION = _config['push']['outbox']['retention_hours'] * 3600
+OUTBOX_RETRY_BACKOFF = _config['push']['outbox']['retry_backoff']
+OUTBOX_CLAIM_TIMEOUT = _config['push']['outbox']['claim_timeout']
\ No newline at end of file
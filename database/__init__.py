@@ -2,4 +2,8 @@ import database.db
 import database.models
 # Import the new modules you created instead
 import database.levels_db_access
-import database.users_db_access
\ No newline at end of file
+import database.users_db_access
+import database.outbox_db_access
+import database.invalidation_db_access
+import database.trending_db_access
+import database.lease_db_access
@@ -0,0 +1,71 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from database.models import INTERACTION_LIKED, INTERACTION_DISLIKED, INTERACTION_CLEARED
+from invalidation import invalidation_bus, INTERACTION
+from config import INTERACTION_CACHE_USERS
+
+FLAGS = (INTERACTION_LIKED, INTERACTION_DISLIKED, INTERACTION_CLEARED)
+
+
+class UserInteractions:
+    """
+    Sorted arrays of the level ids a user liked, disliked and cleared.
+    """
+
+    __slots__ = ("level_ids",)
+
+    def __init__(self, rows: list[tuple[int, int]]):
+        self.level_ids: dict[int, array] = {
+            flag: array('i', sorted(level_id for level_id, flags in rows if flags & flag)) for flag in FLAGS
+        }
+
+    def has(self, level_id: int, flag: int) -> bool:
+        level_ids = self.level_ids[flag]
+        position = bisect_left(level_ids, level_id)
+        return position < len(level_ids) and level_ids[position] == level_id
+
+    def flags_of(self, level_id: int) -> int:
+        return sum(flag for flag in FLAGS if self.has(level_id, flag))
+
+    def add(self, level_id: int, flag: int):
+        if not self.has(level_id, flag):
+            insort(self.level_ids[flag], level_id)
+
+
+class InteractionIndex:
+    """
+    LRU of UserInteractions for the most recently active users.
+    """
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self.users: OrderedDict[int, UserInteractions] = OrderedDict()
+
+    def get(self, user_id: int) -> UserInteractions | None:
+        interactions = self.users.get(user_id)
+        if interactions is not None:
+            self.users.move_to_end(user_id)
+        return interactions
+
+    def put(self, user_id: int, interactions: UserInteractions):
+        self.users[user_id] = interactions
+        self.users.move_to_end(user_id)
+        while len(self.users) > self.max_users:
+            self.users.popitem(last=False)
+
+    def apply(self, changes: list[tuple[int, int, int]]):
+        # changes are (user_id, level_id, flag), users not in the LRU are loaded on their next read
+        for user_id, level_id, flag in changes:
+            interactions = self.users.get(user_id)
+            if interactions is not None:
+                interactions.add(level_id, flag)
+
+    def drop(self, user_id: str):
+        self.users.pop(int(user_id), None)
+
+
+interaction_index = InteractionIndex(max_users=INTERACTION_CACHE_USERS)
+
+# Interactions committed on other workers are not in our arrays, reload the user on the next read
+invalidation_bus.subscribe(INTERACTION, interaction_index.drop, remote_only=True)
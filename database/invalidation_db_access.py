@@ -0,0 +1,79 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import InvalidationEvent
+from sqlalchemy import func, select, insert, delete
+import asyncio
+import datetime
+
+
+class InvalidationDBAccessLayer:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def add_events(self, origin: str, events: list[tuple[str, str]]):
+        now = datetime.datetime.now()
+        await self.session.execute(
+            insert(InvalidationEvent),
+            [{"origin": origin, "kind": kind, "key": key, "created_at": now} for kind, key in events]
+        )
+
+    async def get_last_event_id(self) -> int:
+        return (await self.session.execute(
+            select(func.max(InvalidationEvent.id))
+        )).scalar() or 0
+
+    async def get_events_after(self, event_id: int) -> list[InvalidationEvent]:
+        return (await self.session.execute(
+            select(InvalidationEvent).where(InvalidationEvent.id > event_id).order_by(InvalidationEvent.id.asc())
+        )).scalars().all()
+
+    async def prune_events(self, before: datetime.datetime):
+        await self.session.execute(
+            delete(InvalidationEvent).where(InvalidationEvent.created_at < before)
+        )
+
+    async def commit(self):
+        await self.session.commit()
+
+
+class DatabaseInvalidationBackend:
+    """
+    Invalidation backend for deployments without Redis: events are appended to
+    invalidation_event_table and every worker polls for rows after the last one it saw.
+    """
+
+    def __init__(self, database, poll_interval: float, retention: int):
+        self.db = database
+        self.poll_interval = poll_interval
+        self.retention = retention
+
+    async def publish(self, origin: str, events: list[tuple[str, str]]):
+        async with self.db.async_session() as session:
+            dal = InvalidationDBAccessLayer(session)
+            await dal.add_events(origin=origin, events=events)
+            await dal.commit()
+
+    async def listen(self, origin: str, dispatch):
+        last_event_id: int | None = None
+        polls: int = 0
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                async with self.db.async_session() as session:
+                    dal = InvalidationDBAccessLayer(session)
+                    if last_event_id is None:
+                        # retried on the next poll if the database is locked at startup
+                        last_event_id = await dal.get_last_event_id()
+                        continue
+                    for event in await dal.get_events_after(last_event_id):
+                        last_event_id = event.id
+                        if event.origin != origin:
+                            dispatch(event.kind, event.key)
+                    polls += 1
+                    if polls * self.poll_interval >= 60:
+                        polls = 0
+                        await dal.prune_events(
+                            before=datetime.datetime.now() - datetime.timedelta(seconds=self.retention)
+                        )
+                        await dal.commit()
+            except Exception as e:
+                print(f"Invalidation poll failed: {e}")
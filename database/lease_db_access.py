@@ -0,0 +1,29 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import WorkerLease
+from sqlalchemy import select, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import datetime
+
+
+class LeaseDBAccessLayer:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def acquire(self, name: str, holder: str, ttl: float) -> bool:
+        # takes or renews the lease, only if it's ours or expired, returns whether we hold it
+        now = datetime.datetime.now()
+        expires_at = now + datetime.timedelta(seconds=ttl)
+        await self.session.execute(
+            sqlite_insert(WorkerLease).values(name=name, holder=holder, expires_at=expires_at)
+            .on_conflict_do_update(
+                index_elements=[WorkerLease.name],
+                set_={"holder": holder, "expires_at": expires_at},
+                where=or_(WorkerLease.holder == holder, WorkerLease.expires_at < now)
+            )
+        )
+        return (await self.session.execute(
+            select(WorkerLease.holder).where(WorkerLease.name == name)
+        )).scalar() == holder
+
+    async def commit(self):
+        await self.session.commit()
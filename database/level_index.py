@@ -0,0 +1,100 @@
+from bisect import bisect_left, insort
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from database.models import Level
+from invalidation import invalidation_bus, LISTING
+
+
+class LevelIndex:
+    """
+    Ordered ids of every level and of featured levels, so the newest and
+    promising listings are paginated and counted without touching SQL.
+    Each listing is kept with and without testing client levels.
+    """
+
+    def __init__(self):
+        self.levels: dict[int, tuple[bool, bool]] = {}  # level db id -> (featured, testing_client)
+        # (featured only, include testing client levels) -> ascending level db ids
+        self.lists: dict[tuple[bool, bool], list[int]] = {
+            (featured, testing): [] for featured in (False, True) for testing in (False, True)
+        }
+        self.ready: bool = False
+        self.dirty: bool = True
+        self._rebuilding: bool = False
+        self._pending: list[tuple] = []
+
+    def _lists_of(self, featured: bool, testing_client: bool) -> list[list[int]]:
+        return [
+            ids for (featured_only, include_testing), ids in self.lists.items()
+            if (featured or not featured_only) and (include_testing or not testing_client)
+        ]
+
+    def _add(self, level_db_id: int, featured: bool, testing_client: bool):
+        self._remove(level_db_id)
+        self.levels[level_db_id] = (featured, testing_client)
+        for ids in self._lists_of(featured, testing_client):
+            insort(ids, level_db_id)
+
+    def _remove(self, level_db_id: int):
+        if level_db_id not in self.levels:
+            return
+        for ids in self._lists_of(*self.levels.pop(level_db_id)):
+            position = bisect_left(ids, level_db_id)
+            if position < len(ids) and ids[position] == level_db_id:
+                del ids[position]
+
+    def apply(self, changes: list[tuple]):
+        # changes are ('add', level_db_id, featured, testing_client) or ('remove', level_db_id)
+        if self._rebuilding:
+            self._pending.extend(changes)
+        for change in changes:
+            if change[0] == 'add':
+                self._add(*change[1:])
+            else:
+                self._remove(change[1])
+
+    async def build(self, session: AsyncSession):
+        self._rebuilding = True
+        self._pending = []
+        try:
+            rows = (await session.execute(
+                select(Level.id, Level.featured, Level.testing_client).select_from(Level)
+            )).all()
+        finally:
+            self._rebuilding = False
+        self.levels = {}
+        for ids in self.lists.values():
+            ids.clear()
+        for level_db_id, featured, testing_client in sorted(rows):
+            self.levels[level_db_id] = (bool(featured), bool(testing_client))
+            for ids in self._lists_of(bool(featured), bool(testing_client)):
+                ids.append(level_db_id)
+        # Replay what was committed while the rows were being read
+        self.apply(self._pending)
+        self._pending = []
+        self.ready = True
+        self.dirty = False
+
+    async def ensure(self, session: AsyncSession):
+        if self.dirty and not self._rebuilding:
+            await self.build(session)
+
+    def mark_dirty(self, key: str = None):
+        self.dirty = True
+
+    def count(self, featured: bool, include_testing: bool) -> int:
+        return len(self.lists[(featured, include_testing)])
+
+    def page(self, featured: bool, include_testing: bool, page: int, rows_perpage: int) -> list[int]:
+        # newest first
+        ids = self.lists[(featured, include_testing)]
+        end = len(ids) - (page - 1) * rows_perpage
+        if end <= 0:
+            return []
+        return ids[max(end - rows_perpage, 0):end][::-1]
+
+
+level_index = LevelIndex()
+
+# Changes committed on other workers are not in our index, rebuild it on the next listing
+invalidation_bus.subscribe(LISTING, level_index.mark_dirty, remote_only=True)
@@ -1,25 +1,95 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.models import Level, LevelData, LevelDiscord, ClearedUsers, LikeUsers, DislikeUsers
-from sqlalchemy import func, select, delete
+from database.models import Level, LevelData, LevelDiscord, LevelInteraction, LevelStatsBucket, LevelTombstone, \
+    level_stats_table
+from database.models import INTERACTION_LIKED, INTERACTION_DISLIKED, INTERACTION_CLEARED
+from sqlalchemy import func, select, delete, update, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy import or_, and_
 from config import RECORD_CLEAR_USERS
+from cache import VersionCounter
+from invalidation import invalidation_bus, LEVEL, LISTING, TRENDING, INTERACTION
+from database.level_index import level_index
+from database.interaction_index import interaction_index, UserInteractions
 import datetime
+import time
+from dataclasses import dataclass, fields
+
+# Bumped after commit for every level whose stats, record, featured flag or existence changed
+level_versions = VersionCounter()
+# Bumped after commit when levels are added, deleted or (un)featured, which changes search listings,
+# and when the trending ranking changes order
+listing_versions = VersionCounter()
+
+# Other workers publish the same events, so their writes invalidate our cached renderings too
+invalidation_bus.subscribe(LEVEL, lambda key: level_versions.bump(int(key)))
+invalidation_bus.subscribe(LISTING, lambda key: listing_versions.bump(key))
+invalidation_bus.subscribe(TRENDING, lambda key: listing_versions.bump(key))
+
+
+@dataclass(slots=True)
+class LevelRow:
+    """
+    Read-only level record for listings, loaded without the ORM.
+    """
+    id: int
+    name: str
+    likes: int
+    dislikes: int
+    plays: int
+    deaths: int
+    clears: int
+    style: int
+    environment: int
+    tag_1: int
+    tag_2: int
+    description: str
+    date: datetime.date
+    author_id: int
+    level_id: str
+    non_latin: bool
+    featured: bool
+    record_user_id: int
+    record: int
+    testing_client: bool
+
+
+# Columns in LevelRow field order. Statements built from them are plain Core selects,
+# so their compiled form is reused from SQLAlchemy's statement cache
+LEVEL_ROW_COLUMNS = tuple(getattr(Level, field.name) for field in fields(LevelRow))
+
+
+def select_level_rows():
+    # select_from(Level) keeps level_table and level_stats_table joined
+    return select(*LEVEL_ROW_COLUMNS).select_from(Level)
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
 
 
 class LevelsDBAccessLayer:
     def __init__(self, session: AsyncSession):
         self.session = session
+        self.changed_level_ids: set[int] = set()
+        self.listing_changed: bool = False
+        self.index_changes: list[tuple] = []  # applied to level_index after commit
+        self.interaction_changes: list[tuple[int, int, int]] = []  # applied to interaction_index after commit
 
     async def add_level(self, name: str, style: int, environment: int, tag_1: int, tag_2: int, author_id: int,
                         level_id: str, non_latin: bool, testing_client: bool, description: str):
-        # add level metadata into database
+        # add level metadata into database, every stats column is given so the
+        # joined mapping inserts the level_stats_table row in the same flush
         level = Level(name=name, likes=0, dislikes=0, plays=0, deaths=0, clears=0,
                       style=style, environment=environment, tag_1=tag_1, tag_2=tag_2,
                       date=datetime.date.today(), author_id=author_id,
                       level_id=level_id, non_latin=non_latin, record_user_id=0, record=0,
-                      testing_client=testing_client, featured=False, description=description)
+                      testing_client=testing_client, featured=False, description=description,
+                      updated_at=now_ms())
         self.session.add(level)
         await self.session.flush()
+        self.changed_level_ids.add(level.id)
+        self.listing_changed = True
+        self.index_changes.append(('add', level.id, False, bool(testing_client)))
         return level
     async def get_level_by_level_id(self, level_id: str) -> Level | None:
         """
@@ -30,6 +100,34 @@ class LevelsDBAccessLayer:
         )).scalars().first()
         return level
 
+    async def get_levels_by_ids(self, level_db_ids: list[int]) -> list[Level]:
+        # levels in the order of level_db_ids, missing ones are skipped
+        levels = {level.id: level for level in (await self.session.execute(
+            select(Level).where(Level.id.in_(level_db_ids))
+        )).scalars().all()}
+        return [levels[level_db_id] for level_db_id in level_db_ids if level_db_id in levels]
+
+    async def execute_level_rows(self, selection: select) -> list[LevelRow]:
+        # runs a select_level_rows() statement
+        return [LevelRow(*row) for row in (await self.session.execute(selection)).all()]
+
+    async def get_level_rows_by_ids(self, level_db_ids: list[int]) -> list[LevelRow]:
+        # rows in the order of level_db_ids, missing ones are skipped
+        rows = {row.id: row for row in await self.execute_level_rows(
+            select_level_rows().where(Level.id.in_(level_db_ids))
+        )}
+        return [rows[level_db_id] for level_db_id in level_db_ids if level_db_id in rows]
+
+    async def get_level_rows_by_level_ids(self, level_ids: list[str]) -> dict[str, LevelRow]:
+        # rows keyed by level id with one IN query, missing ones are left out
+        return {row.level_id: row for row in await self.execute_level_rows(
+            select_level_rows().where(Level.level_id.in_(level_ids))
+        )}
+
+    async def get_level_row_by_level_id(self, level_id: str) -> LevelRow | None:
+        rows = await self.execute_level_rows(select_level_rows().where(Level.level_id == level_id).limit(1))
+        return rows[0] if rows else None
+
     async def execute_selection(self, selection: select) -> list[Level]:
         """
         Ejecuta una sentencia de selección de SQLAlchemy y devuelve los resultados.
@@ -37,66 +135,138 @@ class LevelsDBAccessLayer:
         result = await self.session.execute(selection)
         return result.scalars().all()
     
-    async def get_like_type(self, level: Level, user_id: int) -> str:
-        # get user's like type (like or dislike or none) of a level
-        like = (await self.session.execute(
-            select(LikeUsers).where(and_(LikeUsers.parent_id == level.id,
-                                         LikeUsers.user_id == user_id))
-        )).scalars().first()
-        dislike = (await self.session.execute(
-            select(DislikeUsers).where(and_(DislikeUsers.parent_id == level.id,
-                                           DislikeUsers.user_id == user_id))
-        )).scalars().first()
-        if like is not None:
-            return '0'  # like
-        elif dislike is not None:
-            return '1'  # dislike
+    @staticmethod
+    def user_data_of(flags: int) -> tuple[str, str]:
+        # (like type, clear type) of interaction flags
+        if flags & INTERACTION_LIKED:
+            like_type = '0'  # like
+        elif flags & INTERACTION_DISLIKED:
+            like_type = '1'  # dislike
         else:
-            return '3'  # none
+            like_type = '3'  # none
+        return like_type, 'yes' if flags & INTERACTION_CLEARED else 'no'
+
+    async def get_user_interactions(self, user_id: int) -> UserInteractions:
+        # liked, disliked and cleared level ids of the user, kept in interaction_index
+        interactions = interaction_index.get(user_id)
+        if interactions is None:
+            interactions = UserInteractions((await self.session.execute(
+                select(LevelInteraction.level_id, LevelInteraction.flags).where(LevelInteraction.user_id == user_id)
+            )).all())
+            interaction_index.put(user_id, interactions)
+        return interactions
+
+    async def get_user_data(self, level: Level | LevelRow, user_id: int) -> tuple[str, str]:
+        # user's like type and clear type of a level with one primary key probe
+        interactions = interaction_index.get(user_id)
+        if interactions is not None:
+            return self.user_data_of(interactions.flags_of(level.id))
+        flags = (await self.session.execute(
+            select(LevelInteraction.flags).where(and_(LevelInteraction.user_id == user_id,
+                                                      LevelInteraction.level_id == level.id))
+        )).scalar()
+        return self.user_data_of(flags or 0)
+
+    async def get_user_data_by_ids(self, level_db_ids: list[int], user_id: int) -> dict[int, tuple[str, str]]:
+        # user's like type and clear type of a page of levels
+        interactions = await self.get_user_interactions(user_id)
+        return {level_db_id: self.user_data_of(interactions.flags_of(level_db_id)) for level_db_id in level_db_ids}
+
+    async def _set_interaction(self, user_id: int, level: Level, flag: int):
+        # sets a flag on the user's interaction row in one upsert, concurrent requests for the same pair can't collide
+        await self.session.execute(
+            sqlite_insert(LevelInteraction).values(user_id=user_id, level_id=level.id, flags=flag)
+            .on_conflict_do_update(
+                index_elements=[LevelInteraction.user_id, LevelInteraction.level_id],
+                set_={"flags": LevelInteraction.flags.op('|')(flag)}
+            )
+        )
+        self.interaction_changes.append((user_id, level.id, flag))
+
+    async def _add_to_stats_bucket(self, level: Level, **counts: int):
+        # hourly counters for the trending ranking, upserted in the same transaction as the stats
+        await self.session.execute(
+            sqlite_insert(LevelStatsBucket).values(level_db_id=level.id, hour=int(time.time() // 3600), **counts)
+            .on_conflict_do_update(
+                index_elements=[LevelStatsBucket.level_db_id, LevelStatsBucket.hour],
+                set_={name: getattr(LevelStatsBucket, name) + count for name, count in counts.items()}
+            )
+        )
 
     async def add_like_to_level(self, user_id: int, level: Level):
         # add like to level
-        like = LikeUsers(parent_id=level.id, user_id=user_id)
+        await self._set_interaction(user_id, level, INTERACTION_LIKED)
+        await self._add_to_stats_bucket(level, likes=1)
         level.likes += 1
-        self.session.add_all([like, level])
+        self.changed_level_ids.add(level.id)
+        self.session.add(level)
         await self.session.flush()
 
     async def add_dislike_to_level(self, user_id: int, level: Level):
         # add dislike to level
-        dislike = DislikeUsers(parent_id=level.id, user_id=user_id)
+        await self._set_interaction(user_id, level, INTERACTION_DISLIKED)
+        await self._add_to_stats_bucket(level, dislikes=1)
         level.dislikes += 1
-        self.session.add_all([dislike, level])
+        self.changed_level_ids.add(level.id)
+        self.session.add(level)
         await self.session.flush()
 
     async def add_play_to_level(self, level: Level):
         # add play to level
+        await self._add_to_stats_bucket(level, plays=1)
         level.plays += 1
+        self.changed_level_ids.add(level.id)
         self.session.add(level)
         await self.session.flush()
 
     async def add_death_to_level(self, level: Level):
         # add death to level
         level.deaths += 1
+        self.changed_level_ids.add(level.id)
         self.session.add(level)
         await self.session.flush()
 
     async def add_clear_to_level(self, user_id: int, level: Level):
         # add clear to level
         if RECORD_CLEAR_USERS:
-            if (await self.session.execute(
-                    select(ClearedUsers).where(and_(ClearedUsers.parent_id == level.id,
-                                                    ClearedUsers.user_id == user_id))
-            )).scalars().first() is None:
-                clear = ClearedUsers(parent_id=level.id, user_id=user_id)
-                self.session.add(clear)
+            await self._set_interaction(user_id, level, INTERACTION_CLEARED)
+        await self._add_to_stats_bucket(level, clears=1)
         level.clears += 1
+        self.changed_level_ids.add(level.id)
         self.session.add(level)
         await self.session.flush()
 
+    async def add_stats_to_level(self, level: Level | LevelRow, user_id: int, plays: int, deaths: int, clears: int,
+                                 record: int | None) -> dict:
+        # atomic increments of many plays, deaths and clears, and the record if it's beaten
+        stats = level_stats_table.c
+        values = {
+            "plays": stats.plays + plays,
+            "deaths": stats.deaths + deaths,
+            "clears": stats.clears + clears,
+        }
+        if record is not None:
+            # SET expressions all see the old row, so record_user_id follows the same comparison
+            beaten = or_(stats.record == 0, stats.record > record)
+            values["record"] = case((beaten, record), else_=stats.record)
+            values["record_user_id"] = case((beaten, user_id), else_=stats.record_user_id)
+        after = (await self.session.execute(
+            update(level_stats_table).where(stats.level_db_id == level.id).values(**values)
+            .returning(stats.plays, stats.deaths, stats.clears, stats.record, stats.record_user_id)
+        )).one()
+        if clears and RECORD_CLEAR_USERS:
+            await self._set_interaction(user_id, level, INTERACTION_CLEARED)
+        counts = {name: count for name, count in (("plays", plays), ("clears", clears)) if count}
+        if counts:
+            await self._add_to_stats_bucket(level, **counts)
+        self.changed_level_ids.add(level.id)
+        return after._asdict()
+
     async def update_record_to_level(self, user_id: int, level: Level, record: int):
         # update record to level
         level.record_user_id = user_id
         level.record = record
+        self.changed_level_ids.add(level.id)
         self.session.add(level)
         await self.session.flush()
 
@@ -107,43 +277,11 @@ class LevelsDBAccessLayer:
         )).scalars().first()
         return level if (level is not None) else None
 
-    async def get_clear_type(self, level: Level, user_id: int) -> str:
-        # get user's clear type (yes or no) of a level
-        if RECORD_CLEAR_USERS:
-            clear = (await self.session.execute(
-                select(ClearedUsers).where(and_(ClearedUsers.parent_id == level.id,
-                                                ClearedUsers.user_id == user_id))
-            )).scalars().first()
-            if clear is not None:
-                return 'yes'
-            else:
-                return 'no'
-        else:
-            return 'no'
-
-    async def get_liked_levels_by_user(self, user_id: int) -> list[LikeUsers]:
-        # get user's liked levels
-        return (
-            await self.session.execute(
-                select(LikeUsers).where(LikeUsers.user_id == user_id)
-            )
-        ).scalars().all()
-
-    async def get_disliked_levels_by_user(self, user_id: int) -> list[DislikeUsers]:
-        # get user's disliked levels
-        return (
-            await self.session.execute(
-                select(DislikeUsers).where(DislikeUsers.user_id == user_id)
-            )
-        ).scalars().all()
-
-    async def get_cleared_levels_by_user(self, user_id: int) -> list[ClearedUsers]:
-        # get user's cleared levels
-        return (
-            await self.session.execute(
-                select(ClearedUsers).where(ClearedUsers.user_id == user_id)
-            )
-        ).scalars().all()
+    @staticmethod
+    def select_interacted_level_ids(user_id: int, flag: int) -> select:
+        # ids of the levels the user liked, disliked or cleared, used as a semi-join in search
+        return select(LevelInteraction.level_id).where(and_(LevelInteraction.user_id == user_id,
+                                                            LevelInteraction.flags.op('&')(flag) != 0))
 
     async def add_level_data(self, level_id: str, level_data, level_checksum: str):
         # add level data into database as bytes
@@ -183,14 +321,20 @@ class LevelsDBAccessLayer:
         else:
             return None
 
+    async def get_level_discords(self, level_db_ids: list[int]) -> list[LevelDiscord]:
+        return (await self.session.execute(
+            select(LevelDiscord).where(LevelDiscord.level_db_id.in_(level_db_ids))
+        )).scalars().all()
+
     async def delete_level(self, level: Level):
+        self.changed_level_ids.add(level.id)
+        self.listing_changed = True
+        self.index_changes.append(('remove', level.id))
         await self.session.delete(level)
         await self.session.execute(
-            delete(LikeUsers).where(LikeUsers.parent_id == level.id)
-        )
-        await self.session.execute(
-            delete(DislikeUsers).where(DislikeUsers.parent_id == level.id)
+            delete(LevelInteraction).where(LevelInteraction.level_id == level.id)
         )
+        await self.session.merge(LevelTombstone(level_db_id=level.id, level_id=level.level_id, deleted_at=now_ms()))
         await self.session.flush()
 
     async def delete_level_data(self, level_id: str):
@@ -201,6 +345,9 @@ class LevelsDBAccessLayer:
 
     async def set_featured(self, level: Level, is_featured: bool):
         level.featured = is_featured
+        self.changed_level_ids.add(level.id)
+        self.listing_changed = True
+        self.index_changes.append(('add', level.id, is_featured, bool(level.testing_client)))
         self.session.add(level)
         await self.session.flush()
 
@@ -213,5 +360,45 @@ class LevelsDBAccessLayer:
             )
         ).scalars().first()
     
+    async def get_changed_level_rows(self, after: tuple[int, int], until: int, limit: int) -> list[tuple[int, LevelRow]]:
+        # (updated_at, row) of levels changed after the (updated_at, id) cursor, in cursor order
+        updated_at, level_db_id = after
+        rows = (await self.session.execute(
+            select(Level.updated_at, *LEVEL_ROW_COLUMNS).select_from(Level).where(and_(
+                or_(Level.updated_at > updated_at, and_(Level.updated_at == updated_at, Level.id > level_db_id)),
+                Level.updated_at <= until
+            )).order_by(Level.updated_at, Level.id).limit(limit)
+        )).all()
+        return [(row[0], LevelRow(*row[1:])) for row in rows]
+
+    async def get_tombstones(self, after: tuple[int, int], until: int, limit: int) -> list[LevelTombstone]:
+        # levels deleted after the (deleted_at, id) cursor, in cursor order
+        deleted_at, level_db_id = after
+        return (await self.session.execute(
+            select(LevelTombstone).where(and_(
+                or_(LevelTombstone.deleted_at > deleted_at,
+                    and_(LevelTombstone.deleted_at == deleted_at, LevelTombstone.level_db_id > level_db_id)),
+                LevelTombstone.deleted_at <= until
+            )).order_by(LevelTombstone.deleted_at, LevelTombstone.level_db_id).limit(limit)
+        )).scalars().all()
+
     async def commit(self):
-        await self.session.commit()
\ No newline at end of file
+        if self.changed_level_ids:
+            # every mutator records its level here, so one statement keeps updated_at current for all of them
+            await self.session.execute(
+                update(level_stats_table).where(level_stats_table.c.level_db_id.in_(self.changed_level_ids))
+                .values(updated_at=now_ms())
+            )
+        await self.session.commit()
+        for level_db_id in self.changed_level_ids:
+            invalidation_bus.publish(LEVEL, level_db_id)
+        self.changed_level_ids.clear()
+        level_index.apply(self.index_changes)
+        self.index_changes = []
+        interaction_index.apply(self.interaction_changes)
+        for user_id in {user_id for user_id, _, _ in self.interaction_changes}:
+            invalidation_bus.publish(INTERACTION, user_id)
+        self.interaction_changes = []
+        if self.listing_changed:
+            invalidation_bus.publish(LISTING, 'levels')
+            self.listing_changed = False
\ No newline at end of file
@@ -1,33 +1,51 @@
 from database.db import Base
-from sqlalchemy import Column, Integer, UnicodeText, Text, Date, Boolean, LargeBinary, String, BigInteger, SmallInteger
+from sqlalchemy import Column, Integer, UnicodeText, Text, Date, DateTime, Boolean, LargeBinary, String, BigInteger, \
+    SmallInteger, ForeignKey, Table, Float
+from sqlalchemy.orm import column_property
+
+
+level_table = Table(
+    "level_table",
+    Base.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", UnicodeText),  # Level name
+    Column("style", SmallInteger),  # Game style
+    Column("environment", SmallInteger),  # Level environment
+    Column("tag_1", SmallInteger),  # Tag 1
+    Column("tag_2", SmallInteger),  # Tag 2
+    Column("description", UnicodeText),  # Level description
+    Column("date", Date),  # Upload date
+    Column("author_id", Integer),  # Level maker's ID
+    Column("level_id", String(19), index=True),  # Level ID
+    Column("non_latin", Boolean),  # Whether the level name contains non-Latin characters
+    Column("featured", Boolean),  # Whether the level is in promising levels
+    Column("testing_client", Boolean),  # For 3.3.0+ testing client
+    mysql_charset='utf8mb4'
+)
+
+# Counters live in their own narrow table, so stats writes don't rewrite name and description
+level_stats_table = Table(
+    "level_stats_table",
+    Base.metadata,
+    Column("level_db_id", Integer, ForeignKey("level_table.id"), primary_key=True),  # Level's database ID
+    Column("likes", Integer),  # Likes count
+    Column("dislikes", Integer),  # Dislikes count
+    Column("plays", Integer),  # Play count
+    Column("deaths", Integer),  # Death count
+    Column("clears", Integer),  # Clear count
+    Column("record_user_id", Integer),  # Record user's ID
+    Column("record", BigInteger),  # Record (ticks)
+    # Here rather than in level_table, stats writes already rewrite this row and leave level_table alone
+    Column("updated_at", BigInteger, index=True),  # Last change, milliseconds since the Unix epoch
+)
 
 
 class Level(Base):
-    __table_args = {'mysql_charset': 'utf8mb4'}
+    # Mapped to both tables, SQLAlchemy joins them on reads and only writes the changed one
+    __table__ = level_table.join(level_stats_table)
     __mapper_args__ = {"eager_defaults": True}
-    __tablename__ = "level_table"
 
-    id = Column(Integer, primary_key=True)
-
-    name = Column(UnicodeText)  # Level name
-    likes = Column(Integer)  # Likes count
-    dislikes = Column(Integer)  # Dislikes count
-    plays = Column(Integer)  # Play count
-    deaths = Column(Integer)  # Death count
-    clears = Column(Integer)  # Clear count
-    style = Column(SmallInteger)  # Game style
-    environment = Column(SmallInteger)  # Level environment
-    tag_1 = Column(SmallInteger)  # Tag 1
-    tag_2 = Column(SmallInteger)  # Tag 2
-    description = Column(UnicodeText)  # Level description
-    date = Column(Date)  # Upload date
-    author_id = Column(Integer)  # Level maker's ID
-    level_id = Column(String(19))  # Level ID
-    non_latin = Column(Boolean)  # Whether the level name contains non-Latin characters
-    featured = Column(Boolean)  # Whether the level is in promising levels
-    record_user_id = Column(Integer)  # Record user's ID
-    record = Column(BigInteger)  # Record (ticks)
-    testing_client = Column(Boolean)  # For 3.3.0+ testing client
+    id = column_property(level_table.c.id, level_stats_table.c.level_db_id)
 
 
 '''
@@ -123,6 +141,22 @@ class ClearedUsers(Base):
     user_id = Column(Integer)
 
 
+# likes_table, dislikes_table and clears_table are superseded by level_interactions,
+# they are only read by `migrate.py fold-interactions`
+INTERACTION_LIKED = 1
+INTERACTION_DISLIKED = 2
+INTERACTION_CLEARED = 4
+
+
+class LevelInteraction(Base):
+    __tablename__ = "level_interactions"
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    user_id = Column(Integer, primary_key=True)
+    level_id = Column(Integer, primary_key=True)  # Level's database ID
+    flags = Column(SmallInteger, default=0)  # INTERACTION_* bits
+
+
 '''
 class OldUser(Base):
     __tablename__ = "old_user_table"
@@ -184,7 +218,7 @@ class LevelDiscord(Base):
 
     id = Column(Integer, primary_key=True)
 
-    level_db_id = Column(Integer)  # Level id (db)
+    level_db_id = Column(Integer, index=True)  # Level id (db)
     attachment_id = Column(BigInteger)  # Discord attachment ID
 
 
@@ -211,3 +245,65 @@ class Client(Base):  # Client tokens
     locale = Column(String(2))  # Locale
     mobile = Column(Boolean)  # Is mobile client
     proxied = Column(Boolean)  # Whether to proxy level data
+
+
+class WebhookOutbox(Base):  # Pending Engine Bot / Discord notifications
+    __tablename__ = "webhook_outbox_table"
+
+    id = Column(Integer, primary_key=True)
+
+    target = Column(String(16))  # engine_bot or discord
+    payload = Column(UnicodeText)  # JSON encoded payload
+    created_at = Column(DateTime)  # Time the notification was produced
+    attempts = Column(SmallInteger)  # Failed delivery attempts
+    delivered = Column(Boolean, index=True)  # Whether the notification was delivered
+    delivered_urls = Column(UnicodeText)  # JSON list of the webhook URLs already reached
+    next_attempt_at = Column(DateTime)  # Not retried before this time
+    claimed_by = Column(String(32))  # Drain that is delivering the notification
+    claimed_until = Column(DateTime)  # Other drains may claim it again after this time
+
+
+class InvalidationEvent(Base):  # Cache invalidation log shared by workers without Redis
+    __tablename__ = "invalidation_event_table"
+
+    id = Column(Integer, primary_key=True)
+
+    origin = Column(String(32))  # Worker that published the event
+    kind = Column(String(16))  # level, user, client or listing
+    key = Column(String(64))  # Changed item
+    created_at = Column(DateTime)  # Time the event was published
+
+
+class LevelStatsBucket(Base):  # Hourly stats counters, rolled up into level_trending_table
+    __tablename__ = "level_stats_bucket_table"
+
+    level_db_id = Column(Integer, primary_key=True)  # Level's database ID
+    hour = Column(Integer, primary_key=True, index=True)  # Hours since the Unix epoch
+
+    likes = Column(Integer, default=0)  # Likes in this hour
+    dislikes = Column(Integer, default=0)  # Dislikes in this hour
+    plays = Column(Integer, default=0)  # Plays in this hour
+    clears = Column(Integer, default=0)  # Clears in this hour
+
+
+class LevelTombstone(Base):  # Deleted levels, reported by the change feed
+    __tablename__ = "level_tombstone_table"
+
+    level_db_id = Column(Integer, primary_key=True)  # Deleted level's database ID
+    level_id = Column(String(19))  # Deleted level's ID
+    deleted_at = Column(BigInteger, index=True)  # Milliseconds since the Unix epoch
+
+
+class LevelTrending(Base):  # Top trending levels, recomputed by trending.py
+    __tablename__ = "level_trending_table"
+
+    level_db_id = Column(Integer, primary_key=True)  # Level's database ID
+    score = Column(Float, index=True)  # Decayed activity score
+
+
+class WorkerLease(Base):  # Background jobs that must run on a single worker
+    __tablename__ = "worker_lease_table"
+
+    name = Column(String(32), primary_key=True)  # Job name
+    holder = Column(String(32))  # Worker that runs the job
+    expires_at = Column(DateTime)  # Other workers may take the job over after this time
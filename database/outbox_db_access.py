@@ -0,0 +1,73 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import WebhookOutbox
+from sqlalchemy import select, update, delete
+from sqlalchemy import or_, and_
+import datetime
+import json
+
+
+class OutboxDBAccessLayer:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def add_notification(self, target: str, payload: dict | str):
+        # written in the same transaction as the change that produced it
+        notification = WebhookOutbox(
+            target=target,
+            payload=json.dumps(payload, ensure_ascii=False),
+            created_at=datetime.datetime.now(),
+            attempts=0,
+            delivered=False
+        )
+        self.session.add(notification)
+        await self.session.flush()
+
+    async def claim_notifications(self, token: str, limit: int, max_attempts: int,
+                                  lease: float) -> list[WebhookOutbox]:
+        # the UPDATE re-checks the claim, so of two drains racing for a row only one gets it
+        now = datetime.datetime.now()
+        claimable = and_(
+            WebhookOutbox.delivered == False,
+            WebhookOutbox.attempts < max_attempts,
+            or_(WebhookOutbox.next_attempt_at == None, WebhookOutbox.next_attempt_at <= now),
+            or_(WebhookOutbox.claimed_until == None, WebhookOutbox.claimed_until < now)
+        )
+        ids = (await self.session.execute(
+            select(WebhookOutbox.id).where(claimable).order_by(WebhookOutbox.id.asc()).limit(limit)
+        )).scalars().all()
+        if not ids:
+            return []
+        await self.session.execute(
+            update(WebhookOutbox).where(and_(WebhookOutbox.id.in_(ids), claimable))
+            .values(claimed_by=token, claimed_until=now + datetime.timedelta(seconds=lease))
+        )
+        return (await self.session.execute(
+            select(WebhookOutbox).where(WebhookOutbox.claimed_by == token).order_by(WebhookOutbox.id.asc())
+        )).scalars().all()
+
+    async def mark_delivered(self, id: int):
+        await self.session.execute(
+            update(WebhookOutbox).where(WebhookOutbox.id == id).values(delivered=True, claimed_until=None)
+        )
+
+    async def mark_failed(self, id: int, delivered_urls: list[str], next_attempt_at: datetime.datetime):
+        await self.session.execute(
+            update(WebhookOutbox).where(WebhookOutbox.id == id).values(
+                attempts=WebhookOutbox.attempts + 1,
+                delivered_urls=json.dumps(delivered_urls),
+                next_attempt_at=next_attempt_at,
+                claimed_until=None
+            )
+        )
+
+    async def prune_notifications(self, before: datetime.datetime, max_attempts: int):
+        # remove delivered and abandoned notifications in bulk
+        await self.session.execute(
+            delete(WebhookOutbox).where(and_(
+                WebhookOutbox.created_at < before,
+                or_(WebhookOutbox.delivered == True, WebhookOutbox.attempts >= max_attempts)
+            ))
+        )
+
+    async def commit(self):
+        await self.session.commit()
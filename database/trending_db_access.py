@@ -0,0 +1,53 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import LevelStatsBucket, LevelTrending
+from sqlalchemy import select, insert, delete, func, case, literal_column
+
+
+class TrendingDBAccessLayer:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_top_scores(self, since_hour: int, weights: dict[str, float], decay: dict[int, float],
+                             limit: int) -> list[tuple[int, float]]:
+        # weighted activity per level summed in SQL, each hour scaled by its decay factor.
+        # Factors are inlined, one bound parameter per hour could pass SQLite's limit
+        activity = sum(getattr(LevelStatsBucket, name) * weight for name, weight in weights.items())
+        factor = case(
+            {hour: literal_column(repr(value)) for hour, value in decay.items()},
+            value=LevelStatsBucket.hour,
+            else_=literal_column("1.0")
+        )
+        score = func.sum(activity * factor).label("score")
+        return [tuple(row) for row in (await self.session.execute(
+            select(LevelStatsBucket.level_db_id, score)
+            .where(LevelStatsBucket.hour >= since_hour)
+            .group_by(LevelStatsBucket.level_db_id)
+            .having(score > 0)
+            .order_by(score.desc())
+            .limit(limit)
+        )).all()]
+
+    async def prune_buckets(self, before_hour: int):
+        await self.session.execute(
+            delete(LevelStatsBucket).where(LevelStatsBucket.hour < before_hour)
+        )
+
+    async def has_ranking(self) -> bool:
+        return (await self.session.execute(select(LevelTrending.level_db_id).limit(1))).first() is not None
+
+    async def get_trending_ids(self) -> list[int]:
+        return (await self.session.execute(
+            select(LevelTrending.level_db_id).order_by(LevelTrending.score.desc())
+        )).scalars().all()
+
+    async def replace_trending(self, scores: list[tuple[int, float]]):
+        # swapped in one transaction, readers see either the old or the new ranking
+        await self.session.execute(delete(LevelTrending))
+        if scores:
+            await self.session.execute(
+                insert(LevelTrending),
+                [{"level_db_id": level_db_id, "score": score} for level_db_id, score in scores]
+            )
+
+    async def commit(self):
+        await self.session.commit()
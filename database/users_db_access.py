@@ -12,6 +12,10 @@ class UsersDBAccessLayer:
         self.session.add(user)
         await self.session.flush()
 
+    async def update_users(self, users: list[User]):
+        self.session.add_all(users)
+        await self.session.flush()
+
     async def add_user(self, username: str, password_hash: str, im_id: int):
         # register user
         user = User(username=username, password_hash=password_hash, im_id=im_id, uploads=0, is_admin=False,
@@ -34,6 +38,24 @@ class UsersDBAccessLayer:
         )).scalars().first()
         return user if (user is not None) else None
 
+    async def get_usernames_by_ids(self, user_ids: list[int]) -> dict[int, str]:
+        # user names of many users in one query, missing users are left out
+        return dict((await self.session.execute(
+            select(User.id, User.username).where(User.id.in_(set(user_ids)))
+        )).all())
+
+    async def get_users_by_im_ids(self, im_ids: list[int]) -> list[User]:
+        # get many users from IM user ids in one query
+        return (await self.session.execute(
+            select(User).where(User.im_id.in_(set(im_ids)))
+        )).scalars().all()
+
+    async def get_users_by_usernames(self, usernames: list[str]) -> list[User]:
+        # get many users from usernames in one query
+        return (await self.session.execute(
+            select(User).where(User.username.in_(set(usernames)))
+        )).scalars().all()
+
     async def get_user_by_im_id(self, im_id: int) -> User | None:
         # get user from IM user id
         user = (await self.session.execute(
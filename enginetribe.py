@@ -13,7 +13,6 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from redis import asyncio as redis
 import asyncio
-import aiohttp
 
 # Importa ambas clases de la capa de acceso a datos
 
@@ -23,11 +22,21 @@ import routers
 from config import *
 from models import ErrorMessageException
 import push
+import trending
+import analytics
+import migrate
 from database.db import Database
 from storage.onedrive_cf import StorageProviderOneDriveCF
 from storage.onemanager import StorageProviderOneManager
 from storage.database import StorageProviderDatabase
 from storage.discord import StorageProviderDiscord
+from storage.cache import StorageProviderCached
+from http_client import http_client
+from static_proxy import StaticFileProxy
+from common import search_page_cache
+from database.level_index import level_index
+from invalidation import invalidation_bus, RedisInvalidationBackend
+from database.invalidation_db_access import DatabaseInvalidationBackend
 
 
 # Dependencia para obtener la capa de acceso a datos de los usuarios.
@@ -54,6 +63,8 @@ app = FastAPI(
 app.include_router(routers.stage.router)
 app.include_router(routers.user.router)
 app.include_router(routers.client.router)
+app.include_router(routers.changes.router)
+app.include_router(routers.export.router)
 
 # La inicialización de la base de datos se mueve al evento de inicio
 # para asegurar que se crea el motor de forma asíncrona.
@@ -68,24 +79,22 @@ async def favicon_handler() -> FileResponse:
     return FileResponse("web/favicon.ico")
 
 
-_static_file_mimes: dict[str, str] = {}
-_static_file_cache: dict[str, bytes] = {}
-
-
 @app.get("/static/{filename}")
-async def static_file_proxy(filename: str) -> Response:
-    if filename not in _static_file_cache:
-        async with aiohttp.request(
-                method="GET",
-                url=f"http://www.enginetribe.gq/static/{filename}"
-        ) as response:
-            if response.status != 200:
-                return Response(status_code=404)
-            _static_file_mimes[filename] = response.content_type
-            _static_file_cache[filename] = await response.read()
+async def static_file_proxy(request: Request, filename: str) -> Response:
+    static_file = await app.state.static_proxy.get(filename)
+    if static_file is None:
+        return Response(status_code=404)
+    headers = {"Cache-Control": f"public, max-age={STATIC_PROXY_MAX_AGE}"}
+    if static_file.etag:
+        headers["ETag"] = static_file.etag
+        if request.headers.get("If-None-Match") == static_file.etag:
+            return Response(status_code=304, headers=headers)
+    if static_file.last_modified:
+        headers["Last-Modified"] = static_file.last_modified
     return Response(
-        content=_static_file_cache[filename],
-        media_type=_static_file_mimes[filename]
+        content=static_file.content,
+        media_type=static_file.media_type,
+        headers=headers
     )
 
 
@@ -112,6 +121,14 @@ start_time = datetime.datetime.now()
 
 @app.on_event("startup")
 async def startup_event():
+    await http_client.start()
+    app.state.static_proxy = StaticFileProxy(
+        upstream_url=STATIC_PROXY_UPSTREAM_URL,
+        max_bytes=STATIC_PROXY_MAX_SIZE,
+        path=STATIC_PROXY_PATH,
+        max_age=STATIC_PROXY_MAX_AGE,
+        negative_ttl=STATIC_PROXY_NEGATIVE_TTL
+    )
     # Se crean las instancias de la clase Database
     app.state.users_db = Database(
         db_url=USERS_DATABASE_URL,
@@ -119,12 +136,17 @@ async def startup_event():
         db_ssl=DATABASE_SSL
     )
     app.state.levels_db = Database(
-        db_url="sqlite+aiosqlite:///levels.db"
+        db_url=LEVELS_DATABASE_URL
     )
     
     # Se crean las tablas para ambas bases de datos.
     await app.state.users_db.create_all_tables()
     await app.state.levels_db.create_all_tables()
+    await migrate.upgrade_level_schema(app.state.levels_db)
+    await migrate.upgrade_outbox_schema(app.state.levels_db)
+    await migrate.upgrade_outbox_schema(app.state.users_db)
+    async with app.state.levels_db.async_session() as session:
+        await level_index.build(session)
     
     app.state.connection_count = 0
     app.state.storage = {
@@ -145,6 +167,14 @@ async def startup_event():
             attachment_channel=STORAGE_ATTACHMENT_CHANNEL_ID
         )
     }[STORAGE_PROVIDER]
+    if STORAGE_CACHE_ENABLED:
+        app.state.storage = StorageProviderCached(
+            provider=app.state.storage,
+            base_url=API_ROOT,
+            path=STORAGE_CACHE_PATH,
+            max_bytes=STORAGE_CACHE_MAX_SIZE,
+            memory_max_bytes=STORAGE_CACHE_MEMORY_MAX_SIZE
+        )
     app.state.redis = redis.Redis(
         connection_pool=redis.ConnectionPool(
             host=SESSION_REDIS_HOST,
@@ -153,11 +183,24 @@ async def startup_event():
             password=SESSION_REDIS_PASS
         )
     )
+    if SEARCH_CACHE_REDIS:
+        search_page_cache.redis = app.state.redis
     app.state.connection_count = 0
     app.state.connection_per_minute = 0
     asyncio.create_task(connection_per_minute_record())
     asyncio.create_task(push.push_to_engine_bot_sub())
     asyncio.create_task(push.push_to_engine_bot_discord_sub())
+    asyncio.create_task(push.outbox_drainer([app.state.levels_db, app.state.users_db]))
+    asyncio.create_task(trending.trending_updater(app.state.levels_db))
+    asyncio.create_task(analytics.snapshot_refresher(app.state.levels_db))
+    if INVALIDATION_BACKEND == 'redis':
+        asyncio.create_task(invalidation_bus.run(RedisInvalidationBackend(redis=app.state.redis)))
+    elif INVALIDATION_BACKEND == 'database':
+        asyncio.create_task(invalidation_bus.run(DatabaseInvalidationBackend(
+            database=app.state.levels_db,
+            poll_interval=INVALIDATION_POLL_INTERVAL,
+            retention=INVALIDATION_RETENTION
+        )))
 
 
 @app.on_event("shutdown")
@@ -168,6 +211,7 @@ async def shutdown_event():
     # Asegúrate de que los métodos dispose() existen en tu clase Database.
     await app.state.users_db.engine.dispose()
     await app.state.levels_db.engine.dispose()
+    await http_client.close()
 
 
 # get server stats
@@ -185,6 +229,11 @@ async def server_stats(
         "level_count": await levels_dal.get_level_count(),
         "uptime": (datetime.datetime.now() - start_time).seconds,
         "connection_per_minute": app.state.connection_per_minute,
+        "upstreams": http_client.get_stats(),
+        "push": {
+            "engine_bot": push.engine_bot_dispatcher.get_stats(),
+            "discord": push.discord_sender.get_stats(),
+        },
     }
 
 
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from config import (
+    HTTP_LIMIT_PER_HOST,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT
+)
+
+
+@dataclass
+class UpstreamStats:
+    requests: int = 0
+    errors: int = 0
+    total_latency: float = 0.0  # Seconds until response headers are received
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_latency_ms": round(self.total_latency / self.requests * 1000, 2) if self.requests else 0,
+        }
+
+
+class HTTPClient:
+    """
+    Application-wide pooled HTTP client shared by storage providers, pushers and proxies.
+    """
+
+    def __init__(self):
+        self.session: aiohttp.ClientSession | None = None
+        self.stats: dict[str, UpstreamStats] = {}
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit_per_host=HTTP_LIMIT_PER_HOST,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=HTTP_DNS_CACHE_TTL
+            ),
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=HTTP_CONNECT_TIMEOUT,
+                sock_read=HTTP_READ_TIMEOUT
+            )
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+        stats = self.stats.setdefault(urlsplit(url).netloc, UpstreamStats())
+        stats.requests += 1
+        start = time.perf_counter()
+        try:
+            response = await self.session.request(method, url, **kwargs)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            stats.errors += 1
+            raise
+        finally:
+            stats.total_latency += time.perf_counter() - start
+        if response.status >= 500:
+            stats.errors += 1
+        async with response:
+            yield response
+
+    def get_stats(self) -> dict:
+        return {host: stats.to_dict() for host, stats in self.stats.items()}
+
+
+http_client = HTTPClient()
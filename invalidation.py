@@ -0,0 +1,94 @@
+import asyncio
+from asyncio.queues import Queue as AsyncQueue
+import json
+from collections import defaultdict
+from typing import Callable
+from uuid import uuid4
+
+from redis.exceptions import RedisError
+
+# Event kinds
+LEVEL = "level"  # key: level db id
+SESSION = "session"  # key: user id that was banned, invalidated or logged in again, their session is dropped
+LISTING = "listing"  # key: 'levels'
+TRENDING = "trending"  # key: 'levels', the trending ranking changed order
+INTERACTION = "interaction"  # key: user id whose likes, dislikes or clears changed
+
+
+class RedisInvalidationBackend:
+    CHANNEL = "enginetribe:invalidation"
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def publish(self, origin: str, events: list[tuple[str, str]]):
+        await self.redis.publish(self.CHANNEL, json.dumps({"origin": origin, "events": events}))
+
+    async def listen(self, origin: str, dispatch: Callable[[str, str], None]):
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(self.CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = json.loads(message["data"])
+                    if data["origin"] != origin:
+                        for kind, key in data["events"]:
+                            dispatch(kind, key)
+            except RedisError as e:
+                print(f"Invalidation listener disconnected: {e}")
+                await asyncio.sleep(1)
+
+
+class InvalidationBus:
+    """
+    Publishes keyed invalidation events to in-process subscribers and, through
+    a backend, to the other workers.
+    """
+
+    def __init__(self):
+        self.origin: str = uuid4().hex
+        self.subscribers: dict[str, list[tuple[Callable[[str], None], bool, bool]]] = defaultdict(list)
+        self.backend = None
+        self._outgoing: AsyncQueue = AsyncQueue()
+
+    def subscribe(self, kind: str, callback: Callable[[str], None], remote_only: bool = False,
+                  local_only: bool = False):
+        # remote_only callbacks are for caches that already apply their own worker's changes,
+        # local_only ones for shared state that only the worker making the change should update
+        self.subscribers[kind].append((callback, remote_only, local_only))
+
+    def publish(self, kind: str, key: str | int):
+        self.dispatch(kind, str(key), remote=False)
+        if self.backend is not None:
+            self._outgoing.put_nowait((kind, str(key)))
+
+    def dispatch(self, kind: str, key: str, remote: bool = True):
+        for callback, remote_only, local_only in self.subscribers[kind]:
+            if (remote_only and not remote) or (local_only and remote):
+                continue
+            try:
+                callback(key)
+            except Exception as e:
+                print(f"Invalidation subscriber failed: {e}")
+
+    async def _publisher(self):
+        while True:
+            events: list[tuple[str, str]] = [await self._outgoing.get()]
+            while not self._outgoing.empty():
+                events.append(self._outgoing.get_nowait())
+            try:
+                await self.backend.publish(self.origin, events)
+            except Exception as e:
+                print(f"Invalidation publish failed: {e}")
+
+    async def run(self, backend):
+        self.backend = backend
+        await asyncio.gather(
+            self._publisher(),
+            backend.listen(self.origin, self.dispatch)
+        )
+
+
+invalidation_bus = InvalidationBus()
@@ -30,6 +30,9 @@ class LocaleModel:
     UNKNOWN_QUERY_MODE: str
     LEVEL_ID_REPEAT: str
     NOT_IMPLEMENTED: str
+    TOO_MANY_LEVELS: str
+    TOO_MANY_EVENTS: str
+    INVALID_STATS_EVENTS: str
 
 
 @dataclass
@@ -47,6 +50,9 @@ class CN(LocaleModel):
     UNKNOWN_QUERY_MODE: str = '未知查询模式。'
     LEVEL_ID_REPEAT: str = '关卡已存在'
     NOT_IMPLEMENTED: str = '未实现。'
+    TOO_MANY_LEVELS: str = '关卡过多，每次最多 {max} 个。'
+    TOO_MANY_EVENTS: str = '统计事件过多，每次最多 {max} 个。'
+    INVALID_STATS_EVENTS: str = '无效的统计事件。'
 
 
 @dataclass
@@ -64,6 +70,9 @@ class ES(LocaleModel):
     UNKNOWN_QUERY_MODE: str = 'Modo de consulta desconocido.'
     LEVEL_ID_REPEAT: str = 'El nivel ya existe.'
     NOT_IMPLEMENTED: str = 'No se ha implementado.'
+    TOO_MANY_LEVELS: str = 'Demasiados niveles, como máximo {max} por solicitud.'
+    TOO_MANY_EVENTS: str = 'Demasiados eventos, como máximo {max} por solicitud.'
+    INVALID_STATS_EVENTS: str = 'Eventos de estadísticas no válidos.'
 
 
 @dataclass
@@ -81,6 +90,9 @@ class EN(LocaleModel):
     UNKNOWN_QUERY_MODE: str = 'Unknown query mode.'
     LEVEL_ID_REPEAT: str = 'Level already exists.'
     NOT_IMPLEMENTED: str = 'Not implemented.'
+    TOO_MANY_LEVELS: str = 'Too many levels, at most {max} per request.'
+    TOO_MANY_EVENTS: str = 'Too many events, at most {max} per request.'
+    INVALID_STATS_EVENTS: str = 'Invalid stats events.'
 
 
 @dataclass
@@ -98,6 +110,9 @@ class PT(LocaleModel):
     UNKNOWN_QUERY_MODE: str = 'Modo de consulta desconhecido.'
     LEVEL_ID_REPEAT: str = 'O nível já existe.'
     NOT_IMPLEMENTED: str = 'Não implementado.'
+    TOO_MANY_LEVELS: str = 'Níveis demais, no máximo {max} por solicitação.'
+    TOO_MANY_EVENTS: str = 'Eventos demais, no máximo {max} por solicitação.'
+    INVALID_STATS_EVENTS: str = 'Eventos de estatísticas inválidos.'
 
 
 @dataclass
@@ -115,6 +130,9 @@ class IT(LocaleModel):
     UNKNOWN_QUERY_MODE: str = 'Modalità query sconosciuta.'
     LEVEL_ID_REPEAT: str = 'Il livello esiste già.'
     NOT_IMPLEMENTED: str = 'Non implementato.'
+    TOO_MANY_LEVELS: str = 'Troppi livelli, al massimo {max} per richiesta.'
+    TOO_MANY_EVENTS: str = 'Troppi eventi, al massimo {max} per richiesta.'
+    INVALID_STATS_EVENTS: str = 'Eventi statistici non validi.'
 
 
 def get_locale_model(locale: str = "ES"):
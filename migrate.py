@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# Migraciones de esquema de la base de datos de niveles
+# Uso: python migrate.py <comando> [--db-url URL]
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from sqlalchemy import Table, and_, column, func, inspect, literal, or_, select, table as table_clause, text
+
+from config import LEVELS_DATABASE_URL
+from database.db import Base, Database
+from database.models import WebhookOutbox, level_stats_table, INTERACTION_LIKED, INTERACTION_DISLIKED, INTERACTION_CLEARED
+
+STATS_COLUMNS = ("likes", "dislikes", "plays", "deaths", "clears", "record_user_id", "record")
+
+
+async def level_table_columns(database: Database) -> set[str]:
+    async with database.engine.connect() as conn:
+        return await conn.run_sync(
+            lambda sync_conn: {column["name"] for column in inspect(sync_conn).get_columns("level_table")}
+        )
+
+
+async def levels_without_stats(database: Database) -> int:
+    async with database.engine.connect() as conn:
+        return (await conn.execute(text(
+            "SELECT COUNT(*) FROM level_table WHERE id NOT IN (SELECT level_db_id FROM level_stats_table)"
+        ))).scalar()
+
+
+async def split_level_stats(database: Database, drop_old_columns: bool):
+    """
+    Copies the counters of level_table into level_stats_table, levels without counter columns get zeros.
+    Levels that already have a stats row are skipped, so it can be run again safely.
+    """
+    await database.create_all_tables()
+    columns = await level_table_columns(database)
+    has_counters = set(STATS_COLUMNS) <= columns
+    async with database.engine.begin() as conn:
+        values = ', '.join(f'COALESCE({column}, 0)' if has_counters else '0' for column in STATS_COLUMNS)
+        result = await conn.execute(text(
+            f"INSERT INTO level_stats_table (level_db_id, {', '.join(STATS_COLUMNS)}) "
+            f"SELECT id, {values} FROM level_table "
+            f"WHERE id NOT IN (SELECT level_db_id FROM level_stats_table)"
+        ))
+        print(f"Copied counters of {result.rowcount} levels.")
+        if drop_old_columns and has_counters:
+            for column in STATS_COLUMNS:
+                await conn.execute(text(f"ALTER TABLE level_table DROP COLUMN {column}"))
+            print("Dropped counter columns from level_table.")
+
+
+async def fold_interactions(database: Database, clear_old_tables: bool):
+    """
+    Folds likes_table, dislikes_table and clears_table into level_interactions.
+    The legacy flags are or-ed into existing interaction rows, so it can be run again safely.
+    """
+    await database.create_all_tables()
+    async with database.engine.begin() as conn:
+        # UNION drops duplicated rows, so the sum of the distinct flags is their bitwise or
+        result = await conn.execute(text(
+            "INSERT INTO level_interactions (user_id, level_id, flags) "
+            "SELECT user_id, level_id, SUM(flag) FROM ("
+            f"SELECT user_id, parent_id AS level_id, {INTERACTION_LIKED} AS flag FROM likes_table "
+            f"UNION SELECT user_id, parent_id, {INTERACTION_DISLIKED} FROM dislikes_table "
+            f"UNION SELECT user_id, parent_id, {INTERACTION_CLEARED} FROM clears_table"
+            ") AS interactions "
+            "WHERE user_id IS NOT NULL AND level_id IS NOT NULL GROUP BY user_id, level_id "
+            "ON CONFLICT (user_id, level_id) DO UPDATE SET flags = level_interactions.flags | excluded.flags"
+        ))
+        print(f"Folded {result.rowcount} user and level pairs.")
+        if clear_old_tables:
+            for table in ("likes_table", "dislikes_table", "clears_table"):
+                await conn.execute(text(f"DELETE FROM {table}"))
+            print("Emptied likes_table, dislikes_table and clears_table.")
+
+
+async def add_updated_at(database: Database):
+    """
+    Adds updated_at to an existing level_stats_table and stamps the levels that have none,
+    so the change feed reports the whole catalog once. Also creates the updated_at index.
+    """
+    await database.create_all_tables()
+    async with database.engine.connect() as conn:
+        columns = await conn.run_sync(
+            lambda sync_conn: {column["name"] for column in inspect(sync_conn).get_columns("level_stats_table")}
+        )
+    async with database.engine.begin() as conn:
+        if "updated_at" not in columns:
+            await conn.execute(text("ALTER TABLE level_stats_table ADD COLUMN updated_at BIGINT"))
+            print("Added updated_at to level_stats_table.")
+        result = await conn.execute(
+            text("UPDATE level_stats_table SET updated_at = :now WHERE updated_at IS NULL"),
+            {"now": int(time.time() * 1000)}
+        )
+        print(f"Stamped {result.rowcount} levels.")
+        for index in level_stats_table.indexes:
+            await conn.run_sync(lambda sync_conn: index.create(sync_conn, checkfirst=True))
+
+
+async def add_missing_columns(database: Database, table: Table):
+    """
+    Adds the nullable columns of a model that an existing table doesn't have yet.
+    """
+    async with database.engine.begin() as conn:
+        columns = await conn.run_sync(
+            lambda sync_conn: {column["name"] for column in inspect(sync_conn).get_columns(table.name)}
+        )
+        for column in table.columns:
+            if column.name not in columns and column.nullable:
+                await conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+                ))
+                print(f"Added {column.name} to {table.name}.")
+
+
+async def upgrade_level_schema(database: Database):
+    """
+    Run at startup. Level reads inner join level_stats_table, so a level without a stats row
+    would disappear from every listing: split the counters before serving. Every Level select
+    also reads updated_at, so the column is added and stamped here too. Legacy likes, dislikes
+    and clears are folded into level_interactions, which is the only table read for them.
+    """
+    await database.create_all_tables()
+    # the legacy counter columns stay until split-level-stats --drop-old-columns, only missing rows matter
+    if await levels_without_stats(database):
+        print("level_stats_table is behind level_table, splitting level stats.")
+        await split_level_stats(database, drop_old_columns=False)
+    await add_updated_at(database)
+    await fold_interactions(database, clear_old_tables=False)
+
+
+async def upgrade_outbox_schema(database: Database):
+    # run at startup on every database with an outbox, the drain reads the delivery columns
+    await database.create_all_tables()
+    await add_missing_columns(database, WebhookOutbox.__table__)
+
+
+async def create_indexes(database: Database):
+    """
+    Creates the indexes declared in the models that are missing from existing tables,
+    create_all only adds them together with new tables.
+    """
+    await database.create_all_tables()
+    async with database.engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.run_sync(lambda sync_conn: index.create(sync_conn, checkfirst=True))
+                print(f"Index {index.name} ready.")
+
+
+COPY_CHUNK_ROWS = 1000  # Rows read and inserted per statement
+COPY_CHECKPOINT = "copy_checkpoint.json"
+
+
+def load_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    # written aside and renamed, so an interruption never leaves a truncated file
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+
+def after_key(columns: list, key: list):
+    # keyset condition (columns) > (key), spelled out since not every backend has row values
+    return or_(*(
+        and_(*(column == value for column, value in zip(columns[:i], key[:i])), columns[i] > key[i])
+        for i in range(len(columns))
+    ))
+
+
+async def table_columns(database: Database) -> dict[str, set[str]]:
+    async with database.engine.connect() as conn:
+        return await conn.run_sync(lambda sync_conn: {
+            name: {column["name"] for column in inspect(sync_conn).get_columns(name)}
+            for name in inspect(sync_conn).get_table_names()
+        })
+
+
+async def last_key(database: Database, table: Table) -> list | None:
+    async with database.engine.connect() as conn:
+        row = (await conn.execute(
+            select(*table.primary_key.columns).order_by(*(column.desc() for column in table.primary_key.columns))
+            .limit(1)
+        )).first()
+    return list(row) if row is not None else None
+
+
+def source_selection(table: Table, source_columns: set[str]) -> tuple[list, list]:
+    # columns added after the source was created are left to their defaults
+    return [column for column in table.columns if column.name in source_columns], list(table.primary_key.columns)
+
+
+def legacy_stats_selection() -> tuple[list, list]:
+    # a source from before split-level-stats keeps the counters on level_table
+    legacy_level_table = table_clause("level_table", column("id"), *(column(name) for name in STATS_COLUMNS))
+    return [
+        legacy_level_table.c.id.label("level_db_id"),
+        *(func.coalesce(legacy_level_table.c[name], 0).label(name) for name in STATS_COLUMNS),
+        literal(int(time.time() * 1000)).label("updated_at"),
+    ], [legacy_level_table.c.id]
+
+
+async def copy_table(source: Database, target: Database, table: Table, columns: list, key_columns: list,
+                     state: dict, chunk_rows: int, checkpoint: dict, checkpoint_path: str):
+    # columns and key_columns are read from the source, labelled with the names of the target columns
+    key_names = [column.name for column in table.primary_key.columns]
+    # rows already in the target are never copied twice, even if the checkpoint missed the last chunk
+    key = max((k for k in (state.get("last"), await last_key(target, table)) if k is not None), default=None)
+    started, copied = time.monotonic(), 0
+    while True:
+        selection = select(*columns).order_by(*key_columns).limit(chunk_rows)
+        if key is not None:
+            selection = selection.where(after_key(key_columns, key))
+        async with source.engine.connect() as conn:
+            rows = [row._asdict() for row in (await conn.execute(selection)).all()]
+        if not rows:
+            break
+        async with target.engine.begin() as conn:
+            await conn.execute(table.insert(), rows)  # executemany
+        key = [rows[-1][name] for name in key_names]
+        copied += len(rows)
+        state.update(last=key, rows=state.get("rows", 0) + len(rows))
+        save_checkpoint(checkpoint_path, checkpoint)
+        print(f"{table.name}: {state['rows']} rows, {copied / (time.monotonic() - started):.0f} rows/s")
+    state["done"] = True
+    save_checkpoint(checkpoint_path, checkpoint)
+
+
+async def reset_sequences(target: Database, tables: list[Table]):
+    # explicit ids don't advance PostgreSQL sequences, move them past the copied rows
+    async with target.engine.begin() as conn:
+        for table in tables:
+            key_columns = list(table.primary_key.columns)
+            if len(key_columns) == 1 and key_columns[0].autoincrement in (True, "auto") and \
+                    key_columns[0].type.python_type is int:
+                await conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', '{key_columns[0].name}'), "
+                    f"COALESCE((SELECT MAX({key_columns[0].name}) FROM {table.name}), 1))"
+                ))
+
+
+async def copy_database(source: Database, target: Database, chunk_rows: int, checkpoint_path: str,
+                        tables: list[str] | None):
+    """
+    Copies every table of the models that exists in the source into the target, in keyset chunks
+    inserted with executemany. Progress is kept in a checkpoint file, so an interrupted copy
+    continues where it stopped when run again, between the same two databases only.
+    A source with the old schema gets its level counters copied from level_table.
+    """
+    # str() of a URL hides the password, which keeps it out of the checkpoint file
+    urls = {"source": str(source.engine.url), "target": str(target.engine.url)}
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint and {name: checkpoint.get(name) for name in urls} != urls:
+        raise SystemExit(f"{checkpoint_path} belongs to a copy between other databases, "
+                         f"remove it or pass another --checkpoint.")
+    checkpoint.update(urls)
+    await target.create_all_tables()
+    source_tables = await table_columns(source)
+    copied_tables: list[Table] = []
+    # sorted_tables puts referenced tables first, so foreign keys are satisfied on insert
+    for table in Base.metadata.sorted_tables:
+        if tables and table.name not in tables:
+            continue
+        if table.name in source_tables:
+            columns, key_columns = source_selection(table, source_tables[table.name])
+        elif table is level_stats_table and set(STATS_COLUMNS) <= source_tables.get("level_table", set()):
+            columns, key_columns = legacy_stats_selection()
+        else:
+            continue
+        copied_tables.append(table)
+        state = checkpoint.setdefault("tables", {}).setdefault(table.name, {})
+        if state.get("done"):
+            print(f"{table.name}: already copied, skipping.")
+            continue
+        await copy_table(source, target, table, columns, key_columns, state, chunk_rows,
+                         checkpoint, checkpoint_path)
+    if target.engine.dialect.name == "postgresql":
+        await reset_sequences(target, copied_tables)
+    print("Copy finished.")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Engine Tribe database migrations")
+    parser.add_argument("--db-url", default=LEVELS_DATABASE_URL, help="Levels database URL")
+    commands = parser.add_subparsers(dest="command", required=True)
+    split_stats = commands.add_parser("split-level-stats", help="Move level counters into level_stats_table")
+    split_stats.add_argument("--drop-old-columns", action="store_true",
+                             help="Drop the counter columns from level_table afterwards")
+    fold = commands.add_parser("fold-interactions",
+                               help="Merge likes, dislikes and clears into level_interactions")
+    fold.add_argument("--clear-old-tables", action="store_true",
+                      help="Empty likes_table, dislikes_table and clears_table afterwards")
+    copy = commands.add_parser("copy", help="Copy every table from --db-url into another database, resumable")
+    copy.add_argument("--target-url", required=True, help="Database URL to copy into")
+    copy.add_argument("--chunk-size", type=int, default=COPY_CHUNK_ROWS, help="Rows per insert statement")
+    copy.add_argument("--checkpoint", default=COPY_CHECKPOINT, help="Progress file used to resume the copy")
+    copy.add_argument("--tables", nargs="*", help="Only copy these tables")
+    commands.add_parser("add-updated-at", help="Add the change feed timestamp to level_stats_table")
+    commands.add_parser("create-indexes", help="Create missing indexes on existing tables")
+    args = parser.parse_args()
+
+    database = Database(db_url=args.db_url)
+    try:
+        match args.command:
+            case "split-level-stats":
+                await split_level_stats(database, drop_old_columns=args.drop_old_columns)
+            case "fold-interactions":
+                await fold_interactions(database, clear_old_tables=args.clear_old_tables)
+            case "add-updated-at":
+                await add_updated_at(database)
+            case "copy":
+                target = Database(db_url=args.target_url)
+                try:
+                    await copy_database(database, target, chunk_rows=args.chunk_size,
+                                        checkpoint_path=args.checkpoint, tables=args.tables)
+                finally:
+                    await target.engine.dispose()
+            case "create-indexes":
+                await create_indexes(database)
+    finally:
+        await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,5 @@
-from pydantic import BaseModel as PydanticModel
-from typing import Optional, Union
+from pydantic import BaseModel as PydanticModel, Field, TypeAdapter
+from typing import Literal, Optional, Union
 
 
 class ErrorMessage(PydanticModel):
@@ -43,6 +43,44 @@ class UserPermissionSuccessMessage(UserSuccessMessage):
     value: bool
 
 
+class BulkResultMessage(PydanticModel):
+    type: str
+    result: list[dict]  # One result per item, with 'success' or 'error'
+
+
+class BulkRegisterItem(PydanticModel):
+    im_id: int
+    username: str
+    password_hash: str
+
+
+class BulkRegisterRequest(PydanticModel):
+    api_key: str
+    users: list[BulkRegisterItem]
+
+
+class BulkPermissionItem(PydanticModel):
+    user_identifier: str  # IM user ID or username
+    permission: str
+    value: bool
+
+
+class BulkPermissionRequest(PydanticModel):
+    api_key: str
+    permissions: list[BulkPermissionItem]
+
+
+class BulkValidityItem(PydanticModel):
+    user_identifier: str  # IM user ID or username
+    is_valid: Optional[bool] = None
+    is_banned: Optional[bool] = None
+
+
+class BulkValidityRequest(PydanticModel):
+    api_key: str
+    users: list[BulkValidityItem]
+
+
 class ClientSuccessMessage(SuccessMessage):
     success: Optional[str | None]
     type: Optional[str] = "client"
@@ -134,6 +172,35 @@ class SingleLevelDetails(PydanticModel):
     result: LevelDetails
 
 
+class StatEvent(PydanticModel):
+    id: str  # Level ID
+    kind: Literal["intentos", "muertes", "victorias"]  # Play, death or clear
+    count: int = Field(1, ge=1, le=1000)
+    tiempo: Optional[int] = Field(None, gt=0)  # Clear time (ticks), victorias only
+
+
+stat_events_adapter = TypeAdapter(list[StatEvent])
+
+
+# Plain dict builders used by the level listing endpoints, which are serialized with orjson.
+# Key order follows the models above so the output stays identical.
+def detailed_search_results(num_rows: int, rows_perpage: int, pages: int, result: list[dict]) -> dict:
+    return {
+        'type': 'detailed_search',
+        'num_rows': num_rows,
+        'rows_perpage': rows_perpage,
+        'pages': pages,
+        'result': result,
+    }
+
+
+def single_level_details(result: dict, type: str = 'id') -> dict:
+    return {
+        'type': type,
+        'result': result,
+    }
+
+
 class ErrorMessageException(Exception):
     def __init__(
             self,
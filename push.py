@@ -1,51 +1,385 @@
+import asyncio
 from asyncio.queues import Queue as AsyncQueue
+import datetime
+import json
+import time
+import uuid
+from dataclasses import dataclass
+
 import aiohttp
 import discord
 
+from http_client import http_client
+from database.db import Database
+from database.outbox_db_access import OutboxDBAccessLayer
+
 from config import (
     ENGINE_BOT_WEBHOOK_URLS,
+    ENGINE_BOT_QUEUE_SIZE,
+    ENGINE_BOT_QUEUE_OVERFLOW,
+    ENGINE_BOT_WORKERS,
+    ENGINE_BOT_CONCURRENCY_PER_URL,
+    ENGINE_BOT_MAX_RETRIES,
+    ENGINE_BOT_RETRY_BACKOFF,
+    ENGINE_BOT_BREAKER_THRESHOLD,
+    ENGINE_BOT_BREAKER_RESET,
     DISCORD_WEBHOOK_URLS,
     DISCORD_AVATAR_URL,
-    DISCORD_NICKNAME
+    DISCORD_NICKNAME,
+    DISCORD_BATCH_WINDOW,
+    DISCORD_MAX_RETRIES,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETENTION,
+    OUTBOX_RETRY_BACKOFF,
+    OUTBOX_CLAIM_TIMEOUT
 )
 
-engine_bot_push_queue: AsyncQueue = AsyncQueue()
-discord_push_queue: AsyncQueue = AsyncQueue()
-
 __all__ = [
     "push_to_engine_bot",
     "push_to_engine_bot_discord",
 ]
 
 
-async def push_to_engine_bot(data: dict):
+class CircuitBreaker:
+    """
+    Stops calling an endpoint after consecutive failures, then lets a trial
+    request through once reset_timeout seconds have passed.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+@dataclass
+class EndpointStats:
+    delivered: int = 0
+    failed: int = 0
+    retries: int = 0
+    rejected: int = 0  # Skipped because the circuit breaker is open
+    total_latency: float = 0.0
+    attempts: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "avg_latency_ms": round(self.total_latency / self.attempts * 1000, 2) if self.attempts else 0,
+        }
+
+
+class WebhookDispatcher:
+    """
+    Delivers JSON payloads to every webhook URL from a bounded queue with a pool
+    of workers, per-URL concurrency limits, exponential backoff retries and a
+    circuit breaker per URL.
+    """
+
+    def __init__(self, urls: list[str], queue_size: int, overflow: str, workers: int,
+                 concurrency_per_url: int, max_retries: int, retry_backoff: float,
+                 breaker_threshold: int, breaker_reset: float):
+        self.urls = urls
+        self.overflow = overflow  # 'drop' or 'block'
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.queue: AsyncQueue = AsyncQueue(maxsize=queue_size)
+        self.semaphores = {url: asyncio.Semaphore(concurrency_per_url) for url in urls}
+        self.breakers = {url: CircuitBreaker(breaker_threshold, breaker_reset) for url in urls}
+        self.stats = {url: EndpointStats() for url in urls}
+        self.dropped = 0
+
+    async def put(self, data: dict, urls: list[str] | None = None) -> asyncio.Future:
+        # the returned future resolves to the urls, of all or the given ones, the payload reached
+        urls = self.urls if urls is None else urls
+        future = asyncio.get_running_loop().create_future()
+        if self.overflow == 'block':
+            await self.queue.put((data, urls, future))
+            return future
+        try:
+            self.queue.put_nowait((data, urls, future))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            future.set_result([])
+        return future
+
+    async def deliver(self, data: dict, urls: list[str]) -> list[str]:
+        results = await asyncio.gather(*(self._deliver_to(url, data) for url in urls))
+        return [url for url, success in zip(urls, results) if success]
+
+    async def _deliver_to(self, url: str, data: dict) -> bool:
+        breaker = self.breakers[url]
+        stats = self.stats[url]
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                stats.rejected += 1
+                return False
+            async with self.semaphores[url]:
+                start = time.perf_counter()
+                try:
+                    async with http_client.request(method="POST", url=url, json=data) as response:
+                        success = response.status < 400
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    success = False
+                stats.attempts += 1
+                stats.total_latency += time.perf_counter() - start
+            if success:
+                breaker.record_success()
+                stats.delivered += 1
+                return True
+            breaker.record_failure()
+            if attempt < self.max_retries:
+                stats.retries += 1
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+        stats.failed += 1
+        return False
+
+    async def worker(self):
+        while True:
+            data, urls, future = await self.queue.get()
+            delivered: list[str] = []
+            try:
+                delivered = await self.deliver(data, urls)
+            except Exception as e:
+                print(f"Engine Bot push failed: {e}")
+            finally:
+                if not future.done():
+                    future.set_result(delivered)
+                self.queue.task_done()
+
+    def get_stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "dropped": self.dropped,
+            "endpoints": {
+                url: {**stats.to_dict(), "circuit": self.breakers[url].state}
+                for url, stats in self.stats.items()
+            },
+        }
+
+
+class DiscordWebhookSender:
+    """
+    Sends queued messages to Discord webhooks, coalescing the messages queued
+    within batch_window seconds into as few posts as the length limit allows.
+    """
+
+    MAX_MESSAGE_LENGTH = 2000
+
+    def __init__(self, urls: list[str], batch_window: float, max_retries: int, username: str, avatar_url: str):
+        self.urls = urls
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.username = username
+        self.avatar_url = avatar_url
+        self.queue: AsyncQueue = AsyncQueue()
+        self.webhooks: dict[str, discord.Webhook] = {}
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.total_latency = 0.0
+
+    async def put(self, message: str, urls: list[str] | None = None) -> asyncio.Future:
+        # the returned future resolves to the urls, of all or the given ones, the message reached
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((str(message), self.urls if urls is None else urls, future))
+        return future
+
+    def _webhook(self, url: str) -> discord.Webhook:
+        # One webhook client per url, bound to the shared HTTP session
+        if url not in self.webhooks:
+            self.webhooks[url] = discord.Webhook.from_url(url=url, session=http_client.session)
+        return self.webhooks[url]
+
+    async def next_batch(self) -> list[tuple[str, list[str], asyncio.Future]]:
+        messages: list[tuple[str, list[str], asyncio.Future]] = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.batch_window
+        while (remaining := deadline - asyncio.get_running_loop().time()) > 0:
+            try:
+                messages.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return messages
+
+    @classmethod
+    def pack(cls, messages: list[str]) -> list[tuple[str, list[int]]]:
+        # posts with the indices of the messages each one carries
+        posts: list[tuple[str, list[int]]] = []
+        for i, message in enumerate(messages):
+            message = message[:cls.MAX_MESSAGE_LENGTH]
+            if posts and len(posts[-1][0]) + 1 + len(message) <= cls.MAX_MESSAGE_LENGTH:
+                posts[-1] = (posts[-1][0] + '\n' + message, posts[-1][1] + [i])
+            else:
+                posts.append((message, [i]))
+        return posts
+
+    async def _send(self, url: str, content: str):
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                await self._webhook(url).send(content, username=self.username, avatar_url=self.avatar_url)
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == self.max_retries:
+                    raise
+                self.rate_limited += 1
+                await asyncio.sleep(float(e.response.headers.get('Retry-After', 1)))
+            else:
+                self.sent += 1
+                self.total_latency += time.perf_counter() - start
+                return
+
+    async def run(self):
+        while True:
+            messages = await self.next_batch()
+            delivered: list[list[str]] = [[] for _ in messages]
+            for url in self.urls:
+                # only the messages still pending for this url are packed into its posts
+                pending: list[int] = [i for i, (_, urls, _) in enumerate(messages) if url in urls]
+                for content, members in self.pack([messages[i][0] for i in pending]):
+                    try:
+                        await self._send(url, content)
+                    except Exception as e:
+                        self.failed += 1
+                        print(f"Discord push failed: {e}")
+                    else:
+                        for member in members:
+                            delivered[pending[member]].append(url)
+            for (_, _, future), urls in zip(messages, delivered):
+                if not future.done():
+                    future.set_result(urls)
+                self.queue.task_done()
+
+    def get_stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "avg_latency_ms": round(self.total_latency / self.sent * 1000, 2) if self.sent else 0,
+        }
+
+
+engine_bot_dispatcher = WebhookDispatcher(
+    urls=ENGINE_BOT_WEBHOOK_URLS,
+    queue_size=ENGINE_BOT_QUEUE_SIZE,
+    overflow=ENGINE_BOT_QUEUE_OVERFLOW,
+    workers=ENGINE_BOT_WORKERS,
+    concurrency_per_url=ENGINE_BOT_CONCURRENCY_PER_URL,
+    max_retries=ENGINE_BOT_MAX_RETRIES,
+    retry_backoff=ENGINE_BOT_RETRY_BACKOFF,
+    breaker_threshold=ENGINE_BOT_BREAKER_THRESHOLD,
+    breaker_reset=ENGINE_BOT_BREAKER_RESET
+)
+
+discord_sender = DiscordWebhookSender(
+    urls=DISCORD_WEBHOOK_URLS,
+    batch_window=DISCORD_BATCH_WINDOW,
+    max_retries=DISCORD_MAX_RETRIES,
+    username=DISCORD_NICKNAME,
+    avatar_url=DISCORD_AVATAR_URL
+)
+
+
+async def push_to_engine_bot(dal, data: dict):
     # This function is used to push messages to general Engine Bots
     # (Not limited to QQ)
     # You can construct your own Engine Bot with this API for other IMs
-    await engine_bot_push_queue.put(data)
+    # The message is stored in the outbox within dal's transaction and delivered after it commits
+    await OutboxDBAccessLayer(dal.session).add_notification(target="engine_bot", payload=data)
 
 
-async def push_to_engine_bot_discord(message: str):
-    await discord_push_queue.put(message)
+async def push_to_engine_bot_discord(dal, message: str):
+    await OutboxDBAccessLayer(dal.session).add_notification(target="discord", payload=message)
 
 
 async def push_to_engine_bot_sub():
-    while True:
-        data = await engine_bot_push_queue.get()
-        for webhook_url in ENGINE_BOT_WEBHOOK_URLS:
-            async with aiohttp.request(
-                    method="POST",
-                    url=webhook_url,
-                    json=data
-            ) as response:
-                pass
+    await asyncio.gather(*(engine_bot_dispatcher.worker() for _ in range(engine_bot_dispatcher.workers)))
 
 
 async def push_to_engine_bot_discord_sub():
+    await discord_sender.run()
+
+
+async def drain_outbox(database: Database, prune: bool):
+    # Claimed rows are leased to this worker, so other workers polling the same table skip them
+    async with database.async_session() as session:
+        dal = OutboxDBAccessLayer(session)
+        notifications = await dal.claim_notifications(
+            token=uuid.uuid4().hex,
+            limit=OUTBOX_BATCH_SIZE,
+            max_attempts=OUTBOX_MAX_ATTEMPTS,
+            lease=OUTBOX_CLAIM_TIMEOUT
+        )
+        await dal.commit()
+    if not notifications and not prune:
+        return
+
+    # No transaction is held open while waiting on the network
+    futures: list[asyncio.Future] = []
+    for notification in notifications:
+        payload = json.loads(notification.payload)
+        sender = discord_sender if notification.target == "discord" else engine_bot_dispatcher
+        delivered_urls: list[str] = json.loads(notification.delivered_urls or "[]")
+        futures.append(await sender.put(payload, [url for url in sender.urls if url not in delivered_urls]))
+    results: list[list[str]] = await asyncio.gather(*futures)
+
+    async with database.async_session() as session:
+        dal = OutboxDBAccessLayer(session)
+        for notification, urls in zip(notifications, results):
+            sender = discord_sender if notification.target == "discord" else engine_bot_dispatcher
+            delivered_urls: list[str] = json.loads(notification.delivered_urls or "[]") + urls
+            if all(url in delivered_urls for url in sender.urls):
+                await dal.mark_delivered(notification.id)
+            else:
+                # exponential backoff, so an endpoint down for a while doesn't use up the attempts
+                await dal.mark_failed(
+                    notification.id,
+                    delivered_urls=delivered_urls,
+                    next_attempt_at=datetime.datetime.now() + datetime.timedelta(
+                        seconds=OUTBOX_RETRY_BACKOFF * 2 ** notification.attempts
+                    )
+                )
+        if prune:
+            await dal.prune_notifications(
+                before=datetime.datetime.now() - datetime.timedelta(seconds=OUTBOX_RETENTION),
+                max_attempts=OUTBOX_MAX_ATTEMPTS
+            )
+        await dal.commit()
+
+
+async def outbox_drainer(databases: list[Database]):
+    last_prune: float = 0
     while True:
-        message = await discord_push_queue.get()
-        async with aiohttp.ClientSession() as session:
-            for webhook_url in DISCORD_WEBHOOK_URLS:
-                webhook = discord.Webhook.from_url(url=webhook_url, session=session)
-                message: str = str(message)
-                await webhook.send(str(message), username=DISCORD_NICKNAME, avatar_url=DISCORD_AVATAR_URL)
+        prune: bool = time.monotonic() - last_prune > 60
+        if prune:
+            last_prune = time.monotonic()
+        for database in databases:
+            try:
+                await drain_outbox(database, prune=prune)
+            except Exception as e:
+                print(f"Outbox drain failed: {e}")
+        await asyncio.sleep(OUTBOX_POLL_INTERVAL)
@@ -1,3 +1,5 @@
 import routers.stage
 import routers.user
 import routers.client
+import routers.changes
+import routers.export
@@ -0,0 +1,93 @@
+from fastapi import Form, Depends, HTTPException, status
+from fastapi.responses import ORJSONResponse
+from typing import Annotated, Optional
+
+from routers.api_router import APIRouter
+
+from config import API_KEY, CHANGES_MAX_ROWS, CHANGES_SETTLE_MS
+from database.levels_db_access import LevelsDBAccessLayer, LevelRow, now_ms
+from database.models import LevelTombstone
+from depends import create_levels_dal, connection_count_inc
+
+router = APIRouter(
+    prefix="/changes",
+    dependencies=[Depends(connection_count_inc)]
+)
+
+
+def parse_cursor(cursor: str) -> tuple[int, int]:
+    # "<updated_at>.<level_db_id>" of the last change seen, empty to start from the beginning
+    if not cursor:
+        return 0, 0
+    updated_at, level_db_id = cursor.split(".")
+    return int(updated_at), int(level_db_id)
+
+
+def level_row_to_change(updated_at: int, level: LevelRow) -> dict:
+    return {
+        'type': 'level',
+        'updated_at': updated_at,
+        'id': level.level_id,
+        'name': level.name,
+        'description': level.description,
+        'style': level.style,
+        'environment': level.environment,
+        'tags': [level.tag_1, level.tag_2],
+        'date': level.date.isoformat() if level.date else None,
+        'author_id': level.author_id,
+        'likes': level.likes,
+        'dislikes': level.dislikes,
+        'plays': level.plays,
+        'deaths': level.deaths,
+        'clears': level.clears,
+        'record_user_id': level.record_user_id,
+        'record': level.record,
+        'featured': bool(level.featured),
+        'testing_client': bool(level.testing_client),
+    }
+
+
+def tombstone_to_change(tombstone: LevelTombstone) -> dict:
+    return {
+        'type': 'deleted',
+        'updated_at': tombstone.deleted_at,
+        'id': tombstone.level_id,
+    }
+
+
+@router.post("/levels")
+async def changes_levels_handler(
+    api_key: Annotated[str, Form()],
+    dal: Annotated[LevelsDBAccessLayer, Depends(create_levels_dal)],
+    cursor: Annotated[str, Form()] = "",
+    limit: Annotated[Optional[int], Form()] = None
+):
+    """Niveles creados, modificados o eliminados desde el cursor, para mirrors y bots."""
+    if api_key != API_KEY:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API Key.")
+    try:
+        after: tuple[int, int] = parse_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid limit.")
+    limit = min(limit or CHANGES_MAX_ROWS, CHANGES_MAX_ROWS)
+
+    # Both streams share the (timestamp, level_db_id) order, so a page is the first rows of their merge
+    until: int = now_ms() - CHANGES_SETTLE_MS
+    levels = await dal.get_changed_level_rows(after=after, until=until, limit=limit)
+    tombstones = await dal.get_tombstones(after=after, until=until, limit=limit)
+    await dal.commit()
+    changes: list[tuple[tuple[int, int], dict]] = sorted(
+        [((updated_at, level.id), level_row_to_change(updated_at, level)) for updated_at, level in levels] +
+        [((tombstone.deleted_at, tombstone.level_db_id), tombstone_to_change(tombstone)) for tombstone in tombstones],
+        key=lambda change: change[0]
+    )[:limit]
+
+    next_cursor: tuple[int, int] = changes[-1][0] if changes else after
+    return ORJSONResponse({
+        'type': 'changes',
+        'cursor': f"{next_cursor[0]}.{next_cursor[1]}",
+        'has_more': len(levels) == limit or len(tombstones) == limit,
+        'result': [change for _, change in changes]
+    })
@@ -0,0 +1,36 @@
+from fastapi import Form, Depends, Request, HTTPException, status
+from fastapi.responses import StreamingResponse
+from typing import Annotated
+
+from routers.api_router import APIRouter
+
+from config import API_KEY
+from catalog_export import export_catalog, FORMATS
+from depends import connection_count_inc
+
+router = APIRouter(
+    prefix="/export",
+    dependencies=[Depends(connection_count_inc)]
+)
+
+
+@router.post("/levels")
+async def export_levels_handler(
+    request: Request,
+    api_key: Annotated[str, Form()],
+    format: Annotated[str, Form()] = "ndjson",
+    interactions: Annotated[bool, Form()] = False,
+    gzip: Annotated[bool, Form()] = False
+):
+    """Exporta el catálogo de niveles en NDJSON o CSV, en streaming."""
+    if api_key != API_KEY:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API Key.")
+    if format not in FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid format.")
+
+    filename = f"levels.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_catalog(request.app.state.levels_db, format=format, interactions=interactions, compress=gzip),
+        media_type="application/gzip" if gzip else FORMATS[format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
@@ -1,14 +1,14 @@
+import asyncio
 import datetime
 import re
 from math import ceil
 
 from fastapi import Form, Depends, Request
 from routers.api_router import APIRouter
-from fastapi.responses import RedirectResponse, Response
+from fastapi.responses import RedirectResponse, Response, ORJSONResponse
 from typing import Optional
-from sqlalchemy import select, func, and_, or_
-import aiohttp
-
+from pydantic import ValidationError
+from sqlalchemy import select, func, and_, or_, cast, Float
 
 from config import (
     ENABLE_DISCORD_WEBHOOK,
@@ -19,7 +19,9 @@ from config import (
     BOOSTERS_EXTRA_LIMIT,
     UPLOAD_LIMIT,
     ROWS_PERPAGE,
-    RECORD_CLEAR_USERS
+    RECORD_CLEAR_USERS,
+    BATCH_MAX_LEVELS,
+    STATS_BATCH_MAX_EVENTS
 )
 from depends import (
     is_valid_user,
@@ -33,10 +35,11 @@ from locales import parse_tag_names
 from models import (
     ErrorMessage,
     StageSuccessMessage,
-    LevelDetails,
-    SingleLevelDetails,
-    DetailedSearchResults,
-    UserErrorMessage
+    single_level_details,
+    detailed_search_results,
+    UserErrorMessage,
+    StatEvent,
+    stat_events_adapter
 )
 from common import (
     strip_level,
@@ -44,6 +47,9 @@ from common import (
     gen_level_id_sha1,
     gen_level_id_sha256,
     level_to_details,
+    level_details_cache,
+    search_page_cache,
+    with_user_data,
     ClientType,
     get_locale_model
 )
@@ -51,10 +57,17 @@ from push import (
     push_to_engine_bot,
     push_to_engine_bot_discord
 )
-from database.levels_db_access import LevelsDBAccessLayer
+from database.levels_db_access import (
+    LevelsDBAccessLayer, LevelRow, select_level_rows, level_versions, listing_versions
+)
 from database.users_db_access import UsersDBAccessLayer
+from database.trending_db_access import TrendingDBAccessLayer
+from database.level_index import level_index
+from analytics import level_snapshot, DIFFICULTY_RANGES
 from database.models import *
 from session.models import Session
+from storage.cache import StorageProviderCached
+from http_client import http_client
 
 router = APIRouter(
     prefix="/stage",
@@ -64,14 +77,14 @@ router = APIRouter(
     ],
 )
 
-async def get_author_name_by_level(level: Level, users_dal: UsersDBAccessLayer) -> str:
+async def get_author_name_by_level(level: Level | LevelRow, users_dal: UsersDBAccessLayer) -> str:
     author_user = await users_dal.get_user_by_id(level.author_id)
     if author_user is None:
         return "Unknown"
     else:
         return author_user.username
 
-async def get_record_user_name_by_level(level: Level, users_dal: UsersDBAccessLayer) -> str:
+async def get_record_user_name_by_level(level: Level | LevelRow, users_dal: UsersDBAccessLayer) -> str:
     if level.record_user_id == 0:
         return "None"
     else:
@@ -81,6 +94,145 @@ async def get_record_user_name_by_level(level: Level, users_dal: UsersDBAccessLa
         else:
             return record_user.username
 
+def order_by_trending(selection, ranked: bool):
+    # levels of the top N ranking written by trending.py, best first, read through its score index
+    # instead of sorting the whole level table. Before the first rollup, the newest levels
+    selection = selection.order_by(None)
+    if not ranked:
+        return selection.order_by(Level.id.desc())
+    return selection.join(LevelTrending, LevelTrending.level_db_id == Level.id).order_by(LevelTrending.score.desc())
+
+
+COUNTER_MILESTONES = (100, 1000)
+DISCORD_MILESTONE_MESSAGES = {
+    'likes': "tiene **{count}** me gusta!",
+    'plays': "ha sido reproducido **{count}** veces!",
+    'clears': "ha salido victorioso **{count}** veces!",
+}
+
+
+async def push_counter_milestone(
+    levels_dal: LevelsDBAccessLayer,
+    users_dal: UsersDBAccessLayer,
+    level: Level | LevelRow,
+    counter: str,
+    count: int
+):
+    # a counter of the level reached one of COUNTER_MILESTONES
+    if not (ENABLE_DISCORD_WEBHOOK or (ENABLE_ENGINE_BOT_WEBHOOK and ENABLE_ENGINE_BOT_COUNTER_WEBHOOK)):
+        return
+    author_name: str = await get_author_name_by_level(level, users_dal)
+    if ENABLE_DISCORD_WEBHOOK and counter in DISCORD_MILESTONE_MESSAGES:
+        await push_to_engine_bot_discord(
+            levels_dal,
+            f"🎉 Felicidades, el **{level.name}** de **{author_name}** "
+            f"{DISCORD_MILESTONE_MESSAGES[counter].format(count=count)}\n"
+            f"> ID: `{level.level_id}`"
+        )
+    if ENABLE_ENGINE_BOT_WEBHOOK and ENABLE_ENGINE_BOT_COUNTER_WEBHOOK:
+        await push_to_engine_bot(levels_dal, {
+            "type": f"{count}_{counter}",
+            "level_id": level.level_id,
+            "level_name": level.name,
+            "author": author_name,
+        })
+
+
+async def read_with(database, dal_type, read):
+    # runs an independent read on its own pooled connection, so reads of a request can overlap
+    async with database.async_session() as db_session:
+        return await read(dal_type(db_session))
+
+
+async def get_level_details(
+    level: Level | LevelRow,
+    version: int | None,
+    session: Session,
+    storage,
+    users_dal: UsersDBAccessLayer,
+    level_file_url: str | None = None,
+    user_names: dict[int, str] | None = None
+) -> dict:
+    # rendered details without user data, from cache when the level hasn't changed since
+    key: tuple = (level.id, session.locale, session.mobile, session.proxied)
+    details: dict | None = level_details_cache.get(key, version)
+    if details is None:
+        if level_file_url is None:
+            if storage.type == 'discord' and not isinstance(storage, StorageProviderCached):
+                level_file_url = await storage.generate_url(
+                    level_id=level.level_id,
+                    level_db_id=level.id,
+                    proxied=session.proxied
+                )
+            else:
+                level_file_url = storage.generate_url(level.level_id)
+        if user_names is not None:
+            # names already resolved in bulk for the whole page
+            author = user_names.get(level.author_id, "Unknown")
+            record_user = "None" if level.record_user_id == 0 else user_names.get(level.record_user_id, "Unknown")
+        else:
+            author = await get_author_name_by_level(level, users_dal)
+            record_user = await get_record_user_name_by_level(level, users_dal)
+        details = level_to_details(
+            level_data=level,
+            locale=session.locale,
+            level_file_url=level_file_url,
+            mobile=session.mobile,
+            like_type='3',
+            clear_type='no',
+            author=author,
+            record_user=record_user
+        )
+        level_details_cache.put(key, version, details)
+    return details
+
+
+async def get_levels_details(
+    request: Request,
+    levels: list[LevelRow],
+    versions: dict[int, int | None],
+    session: Session,
+    storage,
+    users_dal: UsersDBAccessLayer
+) -> list[dict]:
+    # details with user data of many levels, enriched at once with each read on its own connection
+    level_db_ids: list[int] = [level.id for level in levels]
+    user_ids: list[int] = [level.author_id for level in levels] + [level.record_user_id for level in levels]
+    reads = [
+        read_with(request.app.state.users_db, UsersDBAccessLayer,
+                  lambda dal: dal.get_usernames_by_ids(user_ids)),
+        read_with(request.app.state.levels_db, LevelsDBAccessLayer,
+                  lambda dal: dal.get_user_data_by_ids(level_db_ids, session.user_id)),
+    ]
+    if storage.type == 'discord' and not isinstance(storage, StorageProviderCached):
+        # only discord needs an async lookup per file, the other providers and the cache build urls below
+        reads.append(storage.generate_urls(levels=levels, proxied=session.proxied))
+    user_names, user_data, *level_file_urls = await asyncio.gather(*reads)
+    level_file_urls: dict[int, str] = level_file_urls[0] if level_file_urls else {}
+
+    results: list[dict] = []
+    for level in levels:
+        try:
+            details: dict = await get_level_details(
+                level=level,
+                version=versions[level.id],
+                session=session,
+                storage=storage,
+                users_dal=users_dal,
+                level_file_url=level_file_urls.get(level.id),
+                user_names=user_names
+            )
+            results.append(
+                with_user_data(
+                    details,
+                    *user_data[level.id]
+                )
+            )
+        except Exception as e:
+            print(e)
+    return results
+
+
 @router.post("s/detailed_search")
 async def stages_detailed_search_handler(
     request: Request,
@@ -107,16 +259,19 @@ async def stages_detailed_search_handler(
     client_type = ClientType(session.client_type)
     locale_model = get_locale_model(session.locale)
 
-    results: list[LevelDetails] = []
-
-    selection = select(Level)
+    selection = select_level_rows()
+    # normalized filters of the non user-specific part of the search, used as page cache key
+    search_filters: dict = {
+        "featured": featured,
+        "testing": client_type is ClientType.TESTING,
+    }
 
     if featured:
         match featured:
             case "promising":
                 selection = selection.where(Level.featured == True).order_by(Level.id.desc())
             case "popular":
-                selection = selection.order_by((Level.likes - Level.dislikes).desc())
+                selection = order_by_trending(selection, await TrendingDBAccessLayer(levels_dal.session).has_ranking())
             case "notpromising":
                 selection = selection.where(Level.featured == False)
             case _:
@@ -131,23 +286,29 @@ async def stages_detailed_search_handler(
         page: int = 1
     else:
         page: int = int(page)
+    search_filters["page"] = page
 
     if title:
         title = title.encode("latin1").decode("utf-8")
+        search_filters["title"] = title
         selection = selection.where(Level.name.contains(title))
     if author:
         _author = await users_dal.get_user_by_username(author)
         if _author is not None:
             author_id: int = _author.id
+            search_filters["author_id"] = author_id
             selection = selection.where(Level.author_id == author_id)
         else:
             return ErrorMessage(error_type="006", message=locale_model.ACCOUNT_NOT_FOUND)
     if aparience:
+        search_filters["style"] = int(aparience)
         selection = selection.where(Level.style == int(aparience))
     if entorno:
+        search_filters["environment"] = int(entorno)
         selection = selection.where(Level.environment == int(entorno))
     if last:
         days: int = int(last.strip("d"))
+        search_filters["last"] = (days, datetime.date.today().isoformat())
         selection = selection.where(
             Level.date.between(
                 datetime.date.today() + datetime.timedelta(days=-days),
@@ -155,47 +316,43 @@ async def stages_detailed_search_handler(
             )
         )
     if sort:
+        search_filters["sort"] = (sort, datetime.date.today().isoformat())
         match sort:
             case "antiguos":
-                selection = selection.order_by(Level.id.asc())
+                selection = selection.order_by(None).order_by(Level.id.asc())
             case "popular":
-                selection = selection.where(
-                    Level.date.between(
-                        datetime.date.today() + datetime.timedelta(days=-7),
-                        datetime.date.today(),
+                if featured != "popular":
+                    selection = order_by_trending(
+                        selection, await TrendingDBAccessLayer(levels_dal.session).has_ranking()
                     )
-                )
-                selection = selection.order_by((Level.likes - Level.dislikes).desc())
             case _:
                 return ErrorMessage(error_type="031", message=locale_model.UNKNOWN_QUERY_MODE)
     if liked:
-        level_data_ids: list[int] = []
-        for liked_data in await levels_dal.get_liked_levels_by_user(session.user_id):
-            if liked_data.parent_id not in level_data_ids:
-                level_data_ids.append(liked_data.parent_id)
-        selection = selection.where(Level.id.in_(level_data_ids))
+        selection = selection.where(Level.id.in_(
+            levels_dal.select_interacted_level_ids(session.user_id, INTERACTION_LIKED)
+        ))
     elif disliked:
-        level_data_ids: list[int] = []
-        for disliked_data in await levels_dal.get_disliked_levels_by_user(session.user_id):
-            if disliked_data.parent_id not in level_data_ids:
-                level_data_ids.append(disliked_data.parent_id)
-        selection = selection.where(Level.id.in_(level_data_ids))
+        selection = selection.where(Level.id.in_(
+            levels_dal.select_interacted_level_ids(session.user_id, INTERACTION_DISLIKED)
+        ))
     if dificultad:
+        search_filters["dificultad"] = dificultad
         selection = selection.where(Level.plays != 0)
         match dificultad:
             case "0":
-                selection = selection.where((Level.clears / Level.plays).between(0.2, 10.0))
+                selection = selection.where((cast(Level.clears, Float) / Level.plays).between(0.2, 10.0))
             case "1":
-                selection = selection.where((Level.clears / Level.plays).between(0.08, 0.2))
+                selection = selection.where((cast(Level.clears, Float) / Level.plays).between(0.08, 0.2))
             case "2":
-                selection = selection.where((Level.clears / Level.plays).between(0.01, 0.08))
+                selection = selection.where((cast(Level.clears, Float) / Level.plays).between(0.01, 0.08))
             case "3":
-                selection = selection.where((Level.clears / Level.plays).between(0.0, 0.01))
+                selection = selection.where((cast(Level.clears, Float) / Level.plays).between(0.0, 0.01))
             case _:
                 return ErrorMessage(error_type="030", message=locale_model.UNKNOWN_DIFFICULTY)
     if tags:
         tags = tags.encode("latin1").decode("utf-8")
         tag_1, tag_2 = parse_tag_names(tags, session.locale)
+        search_filters["tags"] = tuple(sorted((tag_1, tag_2)))
         if tag_2==16:
             selection = selection.where(or_(Level.tag_1 == tag_1, Level.tag_2 == tag_1))
         else:
@@ -209,10 +366,7 @@ async def stages_detailed_search_handler(
             return ErrorMessage(error_type="255", message=locale_model.NOT_IMPLEMENTED)
         else:
             if historial in ["0", "1"]:
-                level_data_ids_cleared: list[int] = []
-                for cleared_data in await levels_dal.get_cleared_levels_by_user(session.user_id):
-                    if cleared_data.parent_id not in level_data_ids_cleared:
-                        level_data_ids_cleared.append(cleared_data.parent_id)
+                level_data_ids_cleared = levels_dal.select_interacted_level_ids(session.user_id, INTERACTION_CLEARED)
                 if historial == "0":
                     selection = selection.where(Level.id.in_(level_data_ids_cleared))
                 if historial == "1":
@@ -220,11 +374,47 @@ async def stages_detailed_search_handler(
             else:
                 return ErrorMessage(error_type="031", message=locale_model.UNKNOWN_QUERY_MODE)
 
-    num_rows: int = await levels_dal.get_level_count(selection)
+    # unfiltered newest and promising listings are served from the in-memory index
+    indexed: bool = featured in (None, "promising") and not any(
+        (title, author, aparience, entorno, last, sort, liked, disliked, historial, dificultad, tags)
+    )
+    if indexed:
+        await level_index.ensure(levels_dal.session)
+        indexed = level_index.ready and not level_index.dirty
 
-    selection = selection.offset((page - 1) * ROWS_PERPAGE).limit(ROWS_PERPAGE)
+    # liked, disliked and historial depend on the user, so those pages are never shared
+    page_cache_key: tuple | None = None
+    if not (indexed or liked or disliked or historial):
+        listing_version: int | None = await search_page_cache.version(listing_versions.get('levels'))
+        if listing_version is not None:
+            page_cache_key = (listing_version, *sorted(search_filters.items()))
+    if page_cache_key is not None:
+        cached_page: list | None = await search_page_cache.get(page_cache_key)
+    else:
+        cached_page = None
 
-    levels = await levels_dal.execute_selection(selection)
+    # read before loading the rows, levels bumped after it are rendered but not cached
+    level_clock: int = level_versions.clock
+    if indexed:
+        featured_only: bool = featured == "promising"
+        include_testing: bool = client_type is ClientType.TESTING
+        num_rows: int = level_index.count(featured_only, include_testing)
+        levels = await levels_dal.get_level_rows_by_ids(
+            level_index.page(featured_only, include_testing, page, ROWS_PERPAGE)
+        )
+    elif cached_page is not None:
+        level_db_ids, num_rows = cached_page
+        levels = await levels_dal.get_level_rows_by_ids(level_db_ids)
+    else:
+        levels_db = request.app.state.levels_db
+        page_selection = selection.offset((page - 1) * ROWS_PERPAGE).limit(ROWS_PERPAGE)
+        num_rows, levels = await asyncio.gather(
+            read_with(levels_db, LevelsDBAccessLayer, lambda dal: dal.get_level_count(selection)),
+            read_with(levels_db, LevelsDBAccessLayer, lambda dal: dal.execute_level_rows(page_selection))
+        )
+        if page_cache_key is not None:
+            await search_page_cache.put(page_cache_key, [[level.id for level in levels], num_rows])
+    versions: dict[int, int | None] = {level.id: level_versions.get_as_of(level.id, level_clock) for level in levels}
 
     if num_rows > ROWS_PERPAGE:
         rows_perpage: int = int(rows_perpage) if rows_perpage is not None else ROWS_PERPAGE
@@ -233,44 +423,105 @@ async def stages_detailed_search_handler(
         rows_perpage: int = num_rows
         pages = 1
 
-    for level in levels:
-        try:
-            author_name: str = await get_author_name_by_level(level, users_dal)
-            record_user_name: str = await get_record_user_name_by_level(level, users_dal)
-            if storage.type == 'discord':
-                level_file_url: str = await storage.generate_url(
-                    level_id=level.level_id,
-                    level_db_id=level.id,
-                    proxied=session.proxied
-                )
-            else:
-                level_file_url: str = storage.generate_url(level.level_id)
-            results.append(
-                level_to_details(
-                    level_data=level,
-                    locale=session.locale,
-                    level_file_url=level_file_url,
-                    mobile=session.mobile,
-                    like_type=await levels_dal.get_like_type(level, session.user_id),
-                    clear_type=await levels_dal.get_clear_type(level, session.user_id),
-                    author=author_name,
-                    record_user=record_user_name
-                )
-            )
-        except Exception as e:
-            print(e)
+    results = await get_levels_details(request, levels, versions, session, storage, users_dal)
     await levels_dal.commit()
     if len(results) == 0:
         return ErrorMessage(
             error_type="029", message=locale_model.LEVEL_NOT_FOUND
         )
     else:
-        return DetailedSearchResults(
+        return ORJSONResponse(detailed_search_results(
             num_rows=num_rows,
             rows_perpage=rows_perpage,
             pages=pages,
             result=results
-        )
+        ))
+
+
+@router.post("s/batch")
+async def stages_batch_handler(
+    request: Request,
+    ids: str = Form(),
+    levels_dal: LevelsDBAccessLayer = Depends(create_levels_dal),
+    users_dal: UsersDBAccessLayer = Depends(create_users_dal),
+    auth_code: str = Form(),
+    session: Session = Depends(verify_and_get_session)
+):
+    # details of many levels by comma separated level ids, in the requested order
+    storage = request.app.state.storage
+    locale_model = get_locale_model(session.locale)
+    level_ids: list[str] = list(dict.fromkeys(level_id.strip() for level_id in ids.split(",") if level_id.strip()))
+    if len(level_ids) > BATCH_MAX_LEVELS:
+        return ErrorMessage(error_type="032", message=locale_model.TOO_MANY_LEVELS.format(max=BATCH_MAX_LEVELS))
+
+    level_clock: int = level_versions.clock
+    rows: dict[str, LevelRow] = await levels_dal.get_level_rows_by_level_ids(level_ids)
+    levels: list[LevelRow] = list(rows.values())
+    versions: dict[int, int | None] = {level.id: level_versions.get_as_of(level.id, level_clock) for level in levels}
+    details: dict[str, dict] = {
+        result['id']: result
+        for result in await get_levels_details(request, levels, versions, session, storage, users_dal)
+    }
+    await levels_dal.commit()
+    return ORJSONResponse({
+        'type': 'batch',
+        'result': [
+            details.get(level_id) or {
+                'id': level_id,
+                'error_type': '029',
+                'message': locale_model.LEVEL_NOT_FOUND
+            } for level_id in level_ids
+        ]
+    })
+
+
+@router.post("s/stats/batch")
+async def stages_stats_batch_handler(
+    events: str = Form(),
+    levels_dal: LevelsDBAccessLayer = Depends(create_levels_dal),
+    users_dal: UsersDBAccessLayer = Depends(create_users_dal),
+    auth_code: str = Form(),
+    session: Session = Depends(verify_and_get_session)
+):
+    # plays, deaths and clears of many levels as a JSON list of StatEvent, applied in one transaction
+    locale_model = get_locale_model(session.locale)
+    try:
+        stat_events: list[StatEvent] = stat_events_adapter.validate_json(events)
+    except ValidationError:
+        return ErrorMessage(error_type="033", message=locale_model.INVALID_STATS_EVENTS)
+    if len(stat_events) > STATS_BATCH_MAX_EVENTS:
+        return ErrorMessage(error_type="032", message=locale_model.TOO_MANY_EVENTS.format(max=STATS_BATCH_MAX_EVENTS))
+
+    # sum the events of each level
+    deltas: dict[str, dict] = {}
+    for event in stat_events:
+        delta = deltas.setdefault(event.id, {'plays': 0, 'deaths': 0, 'clears': 0, 'record': None})
+        match event.kind:
+            case "intentos":
+                delta['plays'] += event.count
+            case "muertes":
+                delta['deaths'] += event.count
+            case "victorias":
+                delta['clears'] += event.count
+                if event.tiempo is not None and (delta['record'] is None or event.tiempo < delta['record']):
+                    delta['record'] = event.tiempo
+
+    levels: dict[str, LevelRow] = await levels_dal.get_level_rows_by_level_ids(list(deltas))
+    results: list[dict] = []
+    for level_id, delta in deltas.items():
+        level: LevelRow | None = levels.get(level_id)
+        if level is None:
+            results.append({'id': level_id, 'error_type': '029', 'message': locale_model.LEVEL_NOT_FOUND})
+            continue
+        after: dict = await levels_dal.add_stats_to_level(level=level, user_id=session.user_id, **delta)
+        # milestones crossed between the values before and after this batch
+        for counter in ('plays', 'deaths', 'clears'):
+            for milestone in COUNTER_MILESTONES:
+                if after[counter] - delta[counter] < milestone <= after[counter]:
+                    await push_counter_milestone(levels_dal, users_dal, level, counter, milestone)
+        results.append({'id': level_id, 'success': 'Successfully updated stats'})
+    await levels_dal.commit()
+    return ORJSONResponse({'type': 'stats', 'result': results})
 
 
 @router.post("/{level_id}/stats/likes")
@@ -285,26 +536,13 @@ async def stats_likes_handler(
     level: Level = await levels_dal.get_level_by_level_id(level_id)
     if level is not None:
         await levels_dal.add_like_to_level(user_id=session.user_id, level=level)
-        await levels_dal.commit()
     else:
         return ErrorMessage(
             error_type="029", message=locale_model.LEVEL_NOT_FOUND
         )
-    if level.likes == 100 or level.likes == 1000:
-        if ENABLE_DISCORD_WEBHOOK or (ENABLE_ENGINE_BOT_WEBHOOK and ENABLE_ENGINE_BOT_COUNTER_WEBHOOK):
-            author_name: str = await get_author_name_by_level(level, users_dal)
-            if ENABLE_DISCORD_WEBHOOK:
-                await push_to_engine_bot_discord(
-                    f"🎉 Felicidades, el **{level.name}** de **{author_name}** tiene **{level.likes}** me gusta!\n"
-                    f"> ID: `{level_id}`"
-                )
-            if ENABLE_ENGINE_BOT_WEBHOOK and ENABLE_ENGINE_BOT_COUNTER_WEBHOOK:
-                await push_to_engine_bot({
-                    "type": f"{level.likes}_likes",
-                    "level_id": level_id,
-                    "level_name": level.name,
-                    "author": author_name,
-                })
+    if level.likes in COUNTER_MILESTONES:
+        await push_counter_milestone(levels_dal, users_dal, level, 'likes', level.likes)
+    await levels_dal.commit()
     return StageSuccessMessage(success="Successfully updated likes", type="stats", id=level_id)
 
 
@@ -459,13 +697,14 @@ async def stages_upload_handler(
 
     if ENABLE_DISCORD_WEBHOOK and ENABLE_DISCORD_ARRIVAL_WEBHOOK and storage.type != 'discord':
         await push_to_engine_bot_discord(
+            levels_dal,
             f'📤 **{user.username}** subió un nuevo nivel: **{name}**\n'
             f'> ID: `{level_id}`  Tags: `{tags.split(",")[0].strip()}, {tags.split(",")[1].strip()}`\n'
             f'> Descripción: `{desc}`\n'
             f'> Descargar: {storage.generate_download_url(level_id=level_id)}'
         )
     if ENABLE_ENGINE_BOT_WEBHOOK and ENABLE_ENGINE_BOT_ARRIVAL_WEBHOOK:
-        await push_to_engine_bot({
+        await push_to_engine_bot(levels_dal, {
             "type": "new_arrival",
             "level_id": level_id,
             "level_name": name,
@@ -488,44 +727,41 @@ async def stage_id_random_handler(
     storage = request.app.state.storage
     locale_model = get_locale_model(session.locale)
     user_id: int = session.user_id
-    selection = select(Level).order_by(func.random()).limit(1)
+    selection = select_level_rows().order_by(func.random()).limit(1)
     if dificultad:
         selection = selection.where(Level.plays != 0)
         match dificultad:
             case "0":
-                selection = selection.where((Level.clears / Level.plays).between(0.2, 10.0))
+                selection = selection.where((cast(Level.clears, Float) / Level.plays).between(0.2, 10.0))
             case "1":
-                selection = selection.where((Level.clears / Level.plays).between(0.08, 0.2))
+                selection = selection.where((cast(Level.clears, Float) / Level.plays).between(0.08, 0.2))
             case "2":
-                selection = selection.where((Level.clears / Level.plays).between(0.01, 0.08))
+                selection = selection.where((cast(Level.clears, Float) / Level.plays).between(0.01, 0.08))
             case "3":
-                selection = selection.where((Level.clears / Level.plays).between(0.0, 0.01))
+                selection = selection.where((cast(Level.clears, Float) / Level.plays).between(0.0, 0.01))
             case _:
                 return ErrorMessage(error_type="030", message=locale_model.UNKNOWN_DIFFICULTY)
-    level: Level = (await levels_dal.execute_selection(selection))[0]
-    author_name: str = await get_author_name_by_level(level, users_dal)
-    record_user_name: str = await get_record_user_name_by_level(level, users_dal)
-    if storage.type == 'discord':
-        level_file_url: str = await storage.generate_url(
-            level_id=level.level_id,
-            level_db_id=level.id,
-            proxied=session.proxied
-        )
-    else:
-        level_file_url: str = storage.generate_url(level.level_id)
-    return SingleLevelDetails(
+    levels: list[LevelRow] = []
+    level_clock: int = level_versions.clock
+    if level_snapshot.ready and dificultad in (None, *DIFFICULTY_RANGES):
+        # sample from the in-memory snapshot instead of sorting the table by random()
+        level_db_id: int | None = level_snapshot.random_level_id(level_snapshot.mask(difficulty=dificultad))
+        if level_db_id is not None:
+            levels = await levels_dal.get_level_rows_by_ids([level_db_id])
+    if not levels:
+        levels = await levels_dal.execute_level_rows(selection)
+    if not levels:
+        return ErrorMessage(error_type="029", message=locale_model.LEVEL_NOT_FOUND)
+    level: LevelRow = levels[0]
+    version: int | None = level_versions.get_as_of(level.id, level_clock)
+    details: dict = await get_level_details(level, version, session, storage, users_dal)
+    return ORJSONResponse(single_level_details(
         type="random",
-        result=level_to_details(
-            level_data=level,
-            locale=session.locale,
-            level_file_url=level_file_url,
-            mobile=session.mobile,
-            like_type=await levels_dal.get_like_type(level=level, user_id=user_id),
-            clear_type=await levels_dal.get_clear_type(level=level, user_id=user_id),
-            author=author_name,
-            record_user=record_user_name
+        result=with_user_data(
+            details,
+            *await levels_dal.get_user_data(level=level, user_id=user_id)
         )
-    )
+    ))
 
 
 @router.post("/{level_id}")
@@ -540,37 +776,50 @@ async def stage_id_search_handler(
     storage = request.app.state.storage
     locale_model = get_locale_model(session.locale)
     user_id: int = session.user_id
-    level: Level | None = await levels_dal.get_level_by_level_id(level_id=level_id)
-    if storage.type == 'discord':
-        level_file_url: str = await storage.generate_url(
-            level_id=level.level_id,
-            level_db_id=level.id,
-            proxied=session.proxied
-        )
-    else:
-        level_file_url: str = storage.generate_url(level.level_id)
+    level_clock: int = level_versions.clock
+    level: LevelRow | None = await levels_dal.get_level_row_by_level_id(level_id=level_id)
     if level is not None:
-        author_name: str = await get_author_name_by_level(level, users_dal)
-        record_user_name: str = await get_record_user_name_by_level(level, users_dal)
-        return SingleLevelDetails(
+        version: int | None = level_versions.get_as_of(level.id, level_clock)
+        details: dict = await get_level_details(level, version, session, storage, users_dal)
+        return ORJSONResponse(single_level_details(
             type="id",
-            result=level_to_details(
-                level_data=level,
-                locale=session.locale,
-                level_file_url=level_file_url,
-                mobile=session.mobile,
-                like_type=await levels_dal.get_like_type(level=level, user_id=user_id),
-                clear_type=await levels_dal.get_clear_type(level=level, user_id=user_id),
-                author=author_name,
-                record_user=record_user_name
+            result=with_user_data(
+                details,
+                *await levels_dal.get_user_data(level=level, user_id=user_id)
             )
-        )
+        ))
     else:
         return ErrorMessage(
             error_type="029", message=locale_model.LEVEL_NOT_FOUND
         )
 
 
+async def fetch_level_file(storage, level: Level) -> bytes | None:
+    # fetch level file from the storage provider behind the cache
+    match storage.type:
+        case 'database':
+            level_content = await storage.dump_level_data(level_id=level.level_id)
+            return level_content.encode() if level_content is not None else None
+        case 'discord':
+            url: str = await storage.generate_download_url(
+                level_id=level.level_id,
+                level_db_id=level.id,
+                proxied=False
+            )
+        case _:
+            url: str = storage.generate_download_url(level_id=level.level_id)
+    async with http_client.request(
+            method='GET',
+            url=url,
+            headers={
+                "User-Agent": "EngineTribe"
+            }
+    ) as response:
+        if response.status != 200:
+            return None
+        return await response.read()
+
+
 @router.get("/{level_id}/file")
 async def stage_file_handler(
     request: Request,
@@ -578,6 +827,28 @@ async def stage_file_handler(
     levels_dal: LevelsDBAccessLayer = Depends(create_levels_dal)
 ):
     storage = request.app.state.storage
+    if isinstance(storage, StorageProviderCached):
+        level: Level | None = await levels_dal.get_level_by_level_id(level_id=level_id)
+        if level is None:
+            return ErrorMessage(
+                error_type="029", message="Level not found."
+            )
+        level_content = await storage.get_file(
+            level_id=level_id,
+            fetch=lambda: fetch_level_file(storage, level)
+        )
+        if level_content is None:
+            return ErrorMessage(
+                error_type="029", message="Level not found."
+            )
+        return Response(
+            content=level_content,
+            headers={
+                'Content-Disposition': f'attachment; '
+                                       f'filename="{level.name}.swe"'
+            },
+            media_type='text/plain'
+        )
     match storage.type:
         case 'onedrive-cf':
             return RedirectResponse(storage.generate_download_url(level_id=level_id))
@@ -604,7 +875,7 @@ async def stage_file_handler(
                 return ErrorMessage(
                     error_type="029", message="Level not found."
                 )
-            async with aiohttp.request(
+            async with http_client.request(
                     method='GET',
                     url=await storage.generate_download_url(
                         level_id=level.level_id,
@@ -656,6 +927,8 @@ async def stage_delete_handler(
     await users_dal.commit()
     if storage.type == 'database':
         await storage.delete_level(level_id=level_id)
+    if isinstance(storage, StorageProviderCached):
+        await storage.invalidate(level_id=level_id)
 
     return StageSuccessMessage(
         success="Successfully deleted level", type="stage", id=level_id
@@ -688,21 +961,22 @@ async def switch_promising_handler(
         )
     if not level.featured:
         await levels_dal.set_featured(level=level, is_featured=True)
-        await levels_dal.commit()
         if ENABLE_DISCORD_WEBHOOK or (ENABLE_ENGINE_BOT_WEBHOOK and ENABLE_ENGINE_BOT_COUNTER_WEBHOOK):
             author_name: str = await get_author_name_by_level(level, users_dal)
             if ENABLE_DISCORD_WEBHOOK:
                 await push_to_engine_bot_discord(
+                    levels_dal,
                     f"🌟 El **{level.name}** por **{author_name}** se agrega a niveles prometedores! \n"
                     f"> ID: `{level_id}`"
                 )
             if ENABLE_ENGINE_BOT_WEBHOOK:
-                await push_to_engine_bot({
+                await push_to_engine_bot(levels_dal, {
                     "type": "new_featured",
                     "level_id": level_id,
                     "level_name": level.name,
                     "author": author_name,
                 })
+        await levels_dal.commit()
         return StageSuccessMessage(
             success="Successfully updated featured level", type="promising", id=level_id
         )
@@ -740,22 +1014,9 @@ async def stats_intentos_handler(
             error_type="029", message="Level not found."
         )
     await levels_dal.add_play_to_level(level=level)
+    if level.plays in COUNTER_MILESTONES:
+        await push_counter_milestone(levels_dal, users_dal, level, 'plays', level.plays)
     await levels_dal.commit()
-    if level.plays == 100 or level.plays == 1000:
-        if ENABLE_DISCORD_WEBHOOK or (ENABLE_ENGINE_BOT_WEBHOOK and ENABLE_ENGINE_BOT_COUNTER_WEBHOOK):
-            author_name: str = await get_author_name_by_level(level, users_dal)
-            if ENABLE_DISCORD_WEBHOOK:
-                await push_to_engine_bot_discord(
-                    f"🎉 Felicidades, el **{level.name}** de **{author_name}** ha sido reproducido **{level.plays}** veces!\n"
-                    f"> ID: `{level_id}`"
-                )
-            if ENABLE_ENGINE_BOT_WEBHOOK and ENABLE_ENGINE_BOT_COUNTER_WEBHOOK:
-                await push_to_engine_bot({
-                    "type": f"{level.plays}_plays",
-                    "level_id": level_id,
-                    "level_name": level.name,
-                    "author": author_name,
-                })
     return StageSuccessMessage(
         success="Successfully updated plays", id=level_id, type="stats"
     )
@@ -779,22 +1040,9 @@ async def stats_victorias_handler(
     new_record: int = int(tiempo)
     if level.record == 0 or level.record > new_record:
         await levels_dal.update_record_to_level(user_id=session.user_id, level=level, record=new_record)
+    if level.clears in COUNTER_MILESTONES:
+        await push_counter_milestone(levels_dal, users_dal, level, 'clears', level.clears)
     await levels_dal.commit()
-    if level.clears == 100 or level.clears == 1000:
-        if ENABLE_DISCORD_WEBHOOK or (ENABLE_ENGINE_BOT_WEBHOOK and ENABLE_ENGINE_BOT_COUNTER_WEBHOOK):
-            author_name: str = await get_author_name_by_level(level, users_dal)
-            if ENABLE_DISCORD_WEBHOOK:
-                await push_to_engine_bot_discord(
-                    f"🎉 Felicidades, el **{level.name}** de **{author_name}** ha salido victorioso **{level.clears}** veces!\n"
-                    f"> ID: `{level_id}`"
-                )
-            if ENABLE_ENGINE_BOT_WEBHOOK and ENABLE_ENGINE_BOT_COUNTER_WEBHOOK:
-                await push_to_engine_bot({
-                    "type": f"{level.clears}_clears",
-                    "level_id": level_id,
-                    "level_name": level.name,
-                    "author": author_name,
-                })
     return StageSuccessMessage(
         success="Successfully updated clears", id=level_id, type="stats"
     )
@@ -814,16 +1062,9 @@ async def stats_muertes_handler(
             error_type="029", message="Level not found."
         )
     await levels_dal.add_death_to_level(level=level)
+    if level.deaths in COUNTER_MILESTONES:
+        await push_counter_milestone(levels_dal, users_dal, level, 'deaths', level.deaths)
     await levels_dal.commit()
-    if level.deaths == 100 or level.deaths == 1000:
-        if ENABLE_ENGINE_BOT_WEBHOOK and ENABLE_ENGINE_BOT_COUNTER_WEBHOOK:
-            author_name: str = await get_author_name_by_level(level, users_dal)
-            await push_to_engine_bot({
-                "type": f"{level.deaths}_deaths",
-                "level_id": level_id,
-                "level_name": level.name,
-                "author": author_name,
-            })
     return StageSuccessMessage(
         success="Successfully updated deaths", id=level_id, type="stats"
     )
\ No newline at end of file
@@ -10,7 +10,11 @@ from models import (
     UserPermissionSuccessMessage,
     UserSuccessMessage,
     UserInfoMessage,
-    UserInfo
+    UserInfo,
+    BulkRegisterRequest,
+    BulkPermissionRequest,
+    BulkValidityRequest,
+    BulkResultMessage
 )
 from locales import get_locale_model
 from common import (
@@ -24,6 +28,7 @@ from push import (
 from database.users_db_access import UsersDBAccessLayer
 from database.models import User, Client
 from session.session_access import new_session
+from invalidation import invalidation_bus, SESSION
 from depends import (
     create_users_dal,
     connection_count_inc
@@ -44,6 +49,72 @@ async def get_user_from_identifier(
     else:
         return await dal.get_user_by_username(username=user_identifier)
 
+def set_user_permission(user: User, permission: str, value: bool) -> bool:
+    """Cambia un permiso del usuario, devuelve si cambió un rol que se anuncia."""
+    key_permission_changed: bool = False
+
+    match permission:
+        case "mod":
+            if user.is_mod != value: key_permission_changed = True
+            user.is_mod = value
+        case "admin":
+            user.is_admin = value
+        case "booster":
+            if user.is_booster != value: key_permission_changed = True
+            user.is_booster = value
+        case "valid":
+            user.is_valid = value
+        case "banned":
+            user.is_banned = value
+        case _:
+            raise ValueError(permission)
+    return key_permission_changed
+
+async def push_permission_change(dal: UsersDBAccessLayer, user: User, permission: str, value: bool):
+    """Anuncia el cambio de rol a Engine Bot y Discord."""
+    if ENABLE_ENGINE_BOT_WEBHOOK:
+        await push_to_engine_bot(dal, {
+            'type': 'permission_change',
+            'permission': permission,
+            'username': user.username,
+            'value': value
+        })
+    if ENABLE_DISCORD_WEBHOOK:
+        emoji = '🤗' if value else '😥'
+        role_name = "Booster" if permission == 'booster' else "Stage Moderator"
+        await push_to_engine_bot_discord(
+            dal,
+            f"{emoji} **{user.username}** ahora {'sí' if value else 'no'} "
+            f"tiene el rol **{role_name}** en {DISCORD_SERVER_NAME}!!"
+        )
+
+def publish_user_change(user: User):
+    """Tras el commit, cierra en todos los workers las sesiones de usuarios baneados o inválidos."""
+    if user.is_banned or not user.is_valid:
+        invalidation_bus.publish(SESSION, user.id)
+
+def normalize_identifier(user_identifier: str) -> str:
+    # "007" and "7" are the same IM user ID, as in get_user_from_identifier
+    return str(int(user_identifier)) if user_identifier.isnumeric() else user_identifier
+
+def permission_fields(user: User) -> tuple[bool, ...]:
+    return user.is_mod, user.is_admin, user.is_booster, user.is_valid, user.is_banned
+
+async def get_users_from_identifiers(
+    dal: UsersDBAccessLayer,
+    user_identifiers: list[str]
+) -> dict[str, User]:
+    """Busca varios usuarios por ID de IM o nombre, con una consulta por tipo de identificador.
+    El resultado se indexa por normalize_identifier()."""
+    im_ids: list[int] = [int(identifier) for identifier in user_identifiers if identifier.isnumeric()]
+    usernames: list[str] = [identifier for identifier in user_identifiers if not identifier.isnumeric()]
+    users: dict[str, User] = {}
+    if im_ids:
+        users.update({str(user.im_id): user for user in await dal.get_users_by_im_ids(im_ids=im_ids)})
+    if usernames:
+        users.update({user.username: user for user in await dal.get_users_by_usernames(usernames=usernames)})
+    return users
+
 @router.post("/login")
 async def user_login_handler(
     request: Request,
@@ -150,6 +221,121 @@ async def user_register_handler(
         type="register"
     )
 
+@router.post("/bulk/register")
+async def user_bulk_register_handler(
+    body: BulkRegisterRequest,
+    dal: Annotated[UsersDBAccessLayer, Depends(create_users_dal)]
+):
+    """Registra varias cuentas en una transacción."""
+    if body.api_key != API_KEY:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API Key.")
+
+    existing_im_ids: set[int] = {
+        user.im_id for user in await dal.get_users_by_im_ids(im_ids=[item.im_id for item in body.users])
+    }
+    existing_usernames: set[str] = {
+        user.username for user in await dal.get_users_by_usernames(usernames=[item.username for item in body.users])
+    }
+    results: list[dict] = []
+    for item in body.users:
+        if item.im_id in existing_im_ids:
+            results.append({'username': item.username, 'im_id': str(item.im_id), 'error': "User ID already exists."})
+        elif item.username in existing_usernames:
+            results.append({'username': item.username, 'im_id': str(item.im_id), 'error': "Username already exists."})
+        else:
+            await dal.add_user(username=item.username, password_hash=item.password_hash, im_id=item.im_id)
+            # later items of the same batch conflict with this one too
+            existing_im_ids.add(item.im_id)
+            existing_usernames.add(item.username)
+            results.append({'username': item.username, 'im_id': str(item.im_id), 'success': "Registration success."})
+    await dal.commit()
+
+    return BulkResultMessage(type="register", result=results)
+
+@router.post("/bulk/permission")
+async def user_bulk_permission_handler(
+    body: BulkPermissionRequest,
+    dal: Annotated[UsersDBAccessLayer, Depends(create_users_dal)]
+):
+    """Actualiza permisos de varios usuarios en una transacción."""
+    if body.api_key != API_KEY:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API Key.")
+
+    users: dict[str, User] = await get_users_from_identifiers(
+        dal=dal, user_identifiers=[item.user_identifier for item in body.permissions]
+    )
+    results: list[dict] = []
+    touched_users: dict[int, tuple[User, tuple[bool, ...]]] = {}
+    for item in body.permissions:
+        result: dict = {'user_identifier': item.user_identifier, 'permission': item.permission, 'value': item.value}
+        user: User | None = users.get(normalize_identifier(item.user_identifier))
+        if not user:
+            results.append({**result, 'error': "User not found."})
+            continue
+        touched_users.setdefault(user.id, (user, permission_fields(user)))
+        try:
+            set_user_permission(user=user, permission=item.permission, value=item.value)
+        except ValueError:
+            results.append({**result, 'error': "Permission does not exist."})
+            continue
+        results.append({**result, 'success': "Permission updated."})
+    # only users whose fields end up different are written, and only final role changes are announced,
+    # so a role set and unset in the same request is never announced
+    changed_users: list[User] = [user for user, before in touched_users.values() if permission_fields(user) != before]
+    for user in changed_users:
+        before_mod, _, before_booster, _, _ = touched_users[user.id][1]
+        if user.is_mod != before_mod:
+            await push_permission_change(dal=dal, user=user, permission="mod", value=user.is_mod)
+        if user.is_booster != before_booster:
+            await push_permission_change(dal=dal, user=user, permission="booster", value=user.is_booster)
+    await dal.update_users(users=changed_users)
+    await dal.commit()
+    for user in changed_users:
+        publish_user_change(user)
+
+    return BulkResultMessage(type="update", result=results)
+
+@router.post("/bulk/validity")
+async def user_bulk_validity_handler(
+    body: BulkValidityRequest,
+    dal: Annotated[UsersDBAccessLayer, Depends(create_users_dal)]
+):
+    """Sincroniza la validez y los baneos de varios usuarios en una transacción."""
+    if body.api_key != API_KEY:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API Key.")
+
+    users: dict[str, User] = await get_users_from_identifiers(
+        dal=dal, user_identifiers=[item.user_identifier for item in body.users]
+    )
+    results: list[dict] = []
+    touched_users: dict[int, tuple[User, tuple[bool, ...]]] = {}
+    for item in body.users:
+        if item.is_valid is None and item.is_banned is None:
+            results.append({'user_identifier': item.user_identifier, 'error': "Nothing to update."})
+            continue
+        user: User | None = users.get(normalize_identifier(item.user_identifier))
+        if not user:
+            results.append({'user_identifier': item.user_identifier, 'error': "User not found."})
+            continue
+        touched_users.setdefault(user.id, (user, permission_fields(user)))
+        if item.is_valid is not None:
+            user.is_valid = item.is_valid
+        if item.is_banned is not None:
+            user.is_banned = item.is_banned
+        results.append({
+            'user_identifier': item.user_identifier,
+            'is_valid': user.is_valid,
+            'is_banned': user.is_banned,
+            'success': "Validity updated."
+        })
+    changed_users: list[User] = [user for user, before in touched_users.values() if permission_fields(user) != before]
+    await dal.update_users(users=changed_users)
+    await dal.commit()
+    for user in changed_users:
+        publish_user_change(user)
+
+    return BulkResultMessage(type="update", result=results)
+
 @router.post("/{user_identifier}/permission/{permission}")
 async def user_set_permission_handler(
     user_identifier: str,
@@ -166,43 +352,18 @@ async def user_set_permission_handler(
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found.")
 
-    key_permission_changed: bool = False
-    
-    match permission:
-        case "mod":
-            if user.is_mod != value: key_permission_changed = True
-            user.is_mod = value
-        case "admin":
-            user.is_admin = value
-        case "booster":
-            if user.is_booster != value: key_permission_changed = True
-            user.is_booster = value
-        case "valid":
-            user.is_valid = value
-        case "banned":
-            user.is_banned = value
-        case _:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Permission does not exist.")
+    try:
+        key_permission_changed: bool = set_user_permission(user=user, permission=permission, value=value)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Permission does not exist.")
 
     await dal.update_user(user=user)
-    await dal.commit()
 
     if key_permission_changed:
-        if ENABLE_ENGINE_BOT_WEBHOOK:
-            await push_to_engine_bot({
-                'type': 'permission_change',
-                'permission': permission,
-                'username': user.username,
-                'value': value
-            })
-        if ENABLE_DISCORD_WEBHOOK:
-            emoji = '🤗' if value else '😥'
-            role_name = "Booster" if permission == 'booster' else "Stage Moderator"
-            await push_to_engine_bot_discord(
-                f"{emoji} **{user.username}** ahora {'sí' if value else 'no'} "
-                f"tiene el rol **{role_name}** en {DISCORD_SERVER_NAME}!!"
-            )
-            
+        await push_permission_change(dal=dal, user=user, permission=permission, value=value)
+    await dal.commit()
+    publish_user_change(user)
+
     return UserPermissionSuccessMessage(
         success="Permission updated.",
         type="update",
@@ -4,10 +4,13 @@ from time import time
 from typing import Dict, Optional
 
 from locales import get_locale_model
+from invalidation import invalidation_bus, SESSION
 
 # Diccionarios para simular el almacenamiento en memoria en lugar de Redis
 # session_data: Mapea session_id a objetos de sesión
 # user_session_ids: Mapea user_id a session_id
+# Las sesiones viven en el worker que hizo el login, así que varios workers necesitan un balanceador
+# con afinidad. Los eventos SESSION las cierran en todos los workers: una sesión por usuario.
 session_data: Dict[str, Session] = {}
 user_session_ids: Dict[int, str] = {}
 
@@ -35,8 +38,8 @@ async def new_session(
         proxied=proxied
     )
     
-    # Drop previous session if it exists
-    await drop_session_by_id(user_session_ids.get(user_id))
+    # Drop the previous session on every worker, this one included
+    invalidation_bus.publish(SESSION, user_id)
     
     # Store the new session and its mapping in memory
     session_data[session.session_id] = session
@@ -65,4 +68,15 @@ async def get_session_id_by_user_id(
         user_id: int
 ) -> Optional[str]:
     """Retrieves a session ID from memory by its user ID."""
-    return user_session_ids.get(user_id)
\ No newline at end of file
+    return user_session_ids.get(user_id)
+
+
+def _drop_user_session(user_id: str):
+    # A user was banned, invalidated or logged in again on any worker: end their session here too.
+    # Sessions hold no permission or client data, so other user and client changes leave them alone
+    session_id = user_session_ids.pop(int(user_id), None)
+    if session_id is not None:
+        session_data.pop(session_id, None)
+
+
+invalidation_bus.subscribe(SESSION, _drop_user_session)
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+
+from cache import LRUBytesCache, DiskLRUCache, SingleFlight
+from http_client import http_client
+
+
+@dataclass
+class StaticFile:
+    content: bytes
+    media_type: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+    def serialize(self) -> bytes:
+        header = json.dumps({
+            "media_type": self.media_type,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "fetched_at": self.fetched_at,
+        }, separators=(',', ':')).encode()
+        return header + b'\n' + self.content
+
+
+def deserialize_static_file(data: bytes) -> StaticFile:
+    header, content = data.split(b'\n', 1)
+    return StaticFile(content=content, **json.loads(header))
+
+
+class StaticFileProxy:
+    """
+    Caches files proxied from the upstream /static/ directory.
+    Entries live in a size-bounded LRU, optionally persisted on disk, and are
+    revalidated with ETag / Last-Modified once older than max_age. Missing
+    files are remembered for negative_ttl seconds.
+    """
+
+    NEGATIVE_CACHE_ENTRIES = 4096
+
+    def __init__(self, upstream_url: str, max_bytes: int, path: str, max_age: int, negative_ttl: int):
+        self.upstream_url = upstream_url
+        self.max_age = max_age
+        self.negative_ttl = negative_ttl
+        self.memory = LRUBytesCache(max_bytes=max_bytes, size_of=lambda static_file: len(static_file.content))
+        self.disk: Optional[DiskLRUCache] = DiskLRUCache(path=path, max_bytes=max_bytes) if path else None
+        self._missing: OrderedDict[str, float] = OrderedDict()
+        self._flights = SingleFlight()
+
+    def _is_missing(self, filename: str) -> bool:
+        expires_at = self._missing.get(filename)
+        if expires_at is None:
+            return False
+        if expires_at < time.time():
+            del self._missing[filename]
+            return False
+        return True
+
+    def _mark_missing(self, filename: str):
+        self._missing[filename] = time.time() + self.negative_ttl
+        self._missing.move_to_end(filename)
+        while len(self._missing) > self.NEGATIVE_CACHE_ENTRIES:
+            self._missing.popitem(last=False)
+
+    async def _store(self, filename: str, static_file: StaticFile):
+        self.memory.put(filename, static_file)
+        if self.disk is not None:
+            await self.disk.put(filename, static_file.serialize())
+
+    async def _evict(self, filename: str):
+        self.memory.pop(filename)
+        if self.disk is not None:
+            await self.disk.pop(filename)
+
+    async def get(self, filename: str) -> Optional[StaticFile]:
+        if self._is_missing(filename):
+            return None
+        static_file = self.memory.get(filename)
+        if static_file is None and self.disk is not None:
+            data = await self.disk.get(filename)
+            if data is not None:
+                static_file = deserialize_static_file(data)
+                self.memory.put(filename, static_file)
+        if static_file is not None and time.time() - static_file.fetched_at < self.max_age:
+            return static_file
+        return await self._flights.do(filename, lambda: self._fetch(filename, static_file))
+
+    async def _fetch(self, filename: str, stale: Optional[StaticFile]) -> Optional[StaticFile]:
+        headers = {}
+        if stale is not None:
+            if stale.etag:
+                headers['If-None-Match'] = stale.etag
+            if stale.last_modified:
+                headers['If-Modified-Since'] = stale.last_modified
+        try:
+            async with http_client.request(
+                    method="GET",
+                    url=f"{self.upstream_url}{filename}",
+                    headers=headers
+            ) as response:
+                if response.status == 304 and stale is not None:
+                    stale.fetched_at = time.time()
+                    await self._store(filename, stale)
+                    return stale
+                if response.status == 404:
+                    self._mark_missing(filename)
+                    await self._evict(filename)
+                    return None
+                if response.status != 200:
+                    # Keep serving the stale copy while upstream is unhealthy
+                    return stale
+                static_file = StaticFile(
+                    content=await response.read(),
+                    media_type=response.content_type,
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                    fetched_at=time.time()
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return stale
+        await self._store(filename, static_file)
+        return static_file
@@ -1,3 +1,4 @@
 import storage.onedrive_cf
 import storage.onemanager
-import storage.database
\ No newline at end of file
+import storage.database
+import storage.cache
\ No newline at end of file
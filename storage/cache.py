@@ -0,0 +1,62 @@
+from typing import Awaitable, Callable, Optional
+
+from cache import LRUBytesCache, DiskLRUCache, SingleFlight
+
+
+class StorageProviderCached:
+    """
+    Write-through cache in front of any storage provider.
+    Uploads are stored locally, downloads are served from a memory tier backed
+    by a size-bounded disk tier, and concurrent misses for the same level only
+    hit the upstream provider once. Level file URLs point at /stage/{level_id}/file,
+    so clients download through the cache instead of from the provider.
+    """
+
+    def __init__(self, provider, base_url: str, path: str, max_bytes: int, memory_max_bytes: int):
+        self.provider = provider
+        self.type = provider.type
+        self.base_url = base_url
+        self.memory = LRUBytesCache(max_bytes=memory_max_bytes)
+        self.disk = DiskLRUCache(path=path, max_bytes=max_bytes)
+        self._flights = SingleFlight()
+
+    def __getattr__(self, name: str):
+        # Everything that is not cache related is handled by the wrapped provider
+        return getattr(self.provider, name)
+
+    def generate_url(self, level_id: str, **kwargs) -> str:
+        return f'{self.base_url}stage/{level_id}/file'
+
+    async def generate_urls(self, levels: list, **kwargs) -> dict[int, str]:
+        # same shape as the discord provider, keyed by level db id
+        return {level.id: self.generate_url(level.level_id) for level in levels}
+
+    async def upload_file(self, level_data: str, level_id: str, **kwargs):
+        result = await self.provider.upload_file(level_data=level_data, level_id=level_id, **kwargs)
+        if result is not ConnectionError:
+            await self.store(level_id=level_id, level_data=level_data.encode())
+        return result
+
+    async def store(self, level_id: str, level_data: bytes):
+        self.memory.put(level_id, level_data)
+        await self.disk.put(level_id, level_data)
+
+    async def invalidate(self, level_id: str):
+        self.memory.pop(level_id)
+        await self.disk.pop(level_id)
+
+    async def get_file(self, level_id: str, fetch: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[bytes]:
+        level_data = self.memory.get(level_id)
+        if level_data is not None:
+            return level_data
+        return await self._flights.do(level_id, lambda: self._load(level_id, fetch))
+
+    async def _load(self, level_id: str, fetch: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[bytes]:
+        level_data = await self.disk.get(level_id)
+        if level_data is None:
+            level_data = await fetch()
+            if level_data is None:
+                return None
+            await self.disk.put(level_id, level_data)
+        self.memory.put(level_id, level_data)
+        return level_data
@@ -1,6 +1,6 @@
 from database.db import Database
 from database.levels_db_access import LevelsDBAccessLayer # Importación corregida
-import aiohttp
+from http_client import http_client
 
 
 class StorageProviderDiscord:
@@ -11,6 +11,8 @@ class StorageProviderDiscord:
         self.db = database
         self.attachment_channel = attachment_channel
         self.type = "discord"
+        # Attachment ids never change after upload, so level db id -> attachment id is cached forever
+        self.attachment_ids: dict[int, int] = {}
 
     async def upload_file(
             self,
@@ -23,7 +25,7 @@ class StorageProviderDiscord:
             level_tags: str,
             level_description: str
     ):
-        async with aiohttp.request(
+        async with http_client.request(
                 method='POST',
                 url=f'{self.api_url}/upload',
                 json={
@@ -43,30 +45,48 @@ class StorageProviderDiscord:
                     print(attachment_id)
                     async with self.db.async_session() as session:
                         async with session.begin():
-                            dal = DBAccessLayer(session)
+                            dal = LevelsDBAccessLayer(session)
                             await dal.add_level_discord(
                                 level_db_id=level_db_id,
                                 attachment_id=attachment_id,
                             )
-                            await dal.commit()
+                    self.attachment_ids[level_db_id] = attachment_id
                 else:
                     raise ConnectionError
             else:
                 raise ConnectionError
 
+    def attachment_url(self, level_id: str, attachment_id: int | None) -> str:
+        if attachment_id is None:
+            return ''
+        return f'https://cdn.discordapp.com/attachments/' \
+               f'{self.attachment_channel}/{attachment_id}/{level_id}.swe'
+
     async def generate_url(self, level_id: str, level_db_id: int, proxied: bool) -> str:
         if proxied:
             return f'{self.base_url}stage/{level_id}/file'
-        else:
+        if level_db_id not in self.attachment_ids:
+            async with self.db.async_session() as session:
+                dal = LevelsDBAccessLayer(session)
+                level_discord = await dal.get_level_discord(level_db_id=level_db_id)
+            if level_discord is not None:
+                self.attachment_ids[level_db_id] = level_discord.attachment_id
+        return self.attachment_url(level_id, self.attachment_ids.get(level_db_id))
+
+    async def generate_urls(self, levels: list, proxied: bool) -> dict[int, str]:
+        # resolve a whole page of levels at once, keyed by level db id
+        if proxied:
+            return {level.id: f'{self.base_url}stage/{level.level_id}/file' for level in levels}
+        missing_ids: list[int] = [level.id for level in levels if level.id not in self.attachment_ids]
+        if missing_ids:
             async with self.db.async_session() as session:
-                async with session.begin():
-                    dal = DBAccessLayer(session)
-                    level_discord = await dal.get_level_discord(level_db_id=level_db_id)
-                    if level_discord is not None:
-                        return f'https://cdn.discordapp.com/attachments/' \
-                               f'{self.attachment_channel}/{level_discord.attachment_id}/{level_id}.swe'
-                    else:
-                        return ''
+                dal = LevelsDBAccessLayer(session)
+                for level_discord in await dal.get_level_discords(level_db_ids=missing_ids):
+                    self.attachment_ids[level_discord.level_db_id] = level_discord.attachment_id
+        return {
+            level.id: self.attachment_url(level.level_id, self.attachment_ids.get(level.id))
+            for level in levels
+        }
 
     async def generate_download_url(self, level_id: str, level_db_id: int, proxied: bool) -> str:
         return await self.generate_url(level_id=level_id, level_db_id=level_db_id, proxied=proxied)
@@ -1,4 +1,4 @@
-import aiohttp
+from http_client import http_client
 from urllib.parse import quote
 
 
@@ -12,7 +12,7 @@ class StorageProviderOneDriveCF:
     # noinspection PyBroadException
     async def upload_file(self, level_data: str, level_id: str):
         try:
-            async with aiohttp.request(
+            async with http_client.request(
                     method="POST",
                     url=self.url,
                     data=level_data,
@@ -1,4 +1,5 @@
 import aiohttp
+from http_client import http_client
 from hashlib import md5
 from io import BytesIO
 from time import time
@@ -21,7 +22,7 @@ class StorageProviderOneManager:
                              )
 
         try:
-            async with aiohttp.request(
+            async with http_client.request(
                     method="POST",
                     url=self.url + '?action=upsmallfile',
                     data=postfields,
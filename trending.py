@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+from database.db import Database
+from database.trending_db_access import TrendingDBAccessLayer
+from database.lease_db_access import LeaseDBAccessLayer
+from invalidation import invalidation_bus, TRENDING
+
+from config import (
+    TRENDING_INTERVAL,
+    TRENDING_WINDOW_HOURS,
+    TRENDING_HALF_LIFE_HOURS,
+    TRENDING_TOP_N,
+    TRENDING_WEIGHTS
+)
+
+
+def decay_factors(now_hour: int) -> dict[int, float]:
+    # weight of each hour of the window, halving every TRENDING_HALF_LIFE_HOURS
+    return {
+        hour: 0.5 ** ((now_hour - hour) / TRENDING_HALF_LIFE_HOURS)
+        for hour in range(now_hour - TRENDING_WINDOW_HOURS, now_hour + 1)
+    }
+
+
+async def rollup_trending(database: Database):
+    now_hour = int(time.time() // 3600)
+    async with database.async_session() as session:
+        # one worker computes the ranking, the others take over if it stops renewing the lease
+        if not await LeaseDBAccessLayer(session).acquire(name="trending", holder=invalidation_bus.origin,
+                                                         ttl=TRENDING_INTERVAL * 3):
+            await session.commit()
+            return
+        dal = TrendingDBAccessLayer(session)
+        await dal.prune_buckets(before_hour=now_hour - TRENDING_WINDOW_HOURS)
+        previous: list[int] = await dal.get_trending_ids()
+        ranking = await dal.get_top_scores(since_hour=now_hour - TRENDING_WINDOW_HOURS, weights=TRENDING_WEIGHTS,
+                                           decay=decay_factors(now_hour), limit=TRENDING_TOP_N)
+        await dal.replace_trending(ranking)
+        await dal.commit()
+    # cached "popular" pages are only stale when the order changed. Not a LISTING change:
+    # the set of levels is the same, so the other workers keep their level index
+    if [level_db_id for level_db_id, _ in ranking] != previous:
+        invalidation_bus.publish(TRENDING, 'levels')
+
+
+async def trending_updater(database: Database):
+    while True:
+        try:
+            await rollup_trending(database)
+        except Exception as e:
+            print(f"Trending rollup failed: {e}")
+        await asyncio.sleep(TRENDING_INTERVAL)